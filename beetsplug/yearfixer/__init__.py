@@ -6,14 +6,25 @@
 
 import os
 
+from beets.dbcore import types
+from beets.library import Library, Item, Album
 from beets.plugins import BeetsPlugin
 from confuse import ConfigSource, load_yaml
 
+from beetsplug.yearfixer import common
 from beetsplug.yearfixer.command import YearFixerCommand
+from beetsplug.yearfixer.index_command import YearFixerIndexCommand
+from beetsplug.yearfixer.means import is_valid_year
 
 
 class YearFixerPlugin(BeetsPlugin):
     _default_plugin_config_file_name_ = 'config_default.yml'
+    command: YearFixerCommand = None
+    item_types = {
+        common.CHECKED_ATTR: types.FLOAT,
+        common.OUTCOME_ATTR: types.STRING,
+        common.MTIME_ATTR: types.FLOAT,
+    }
 
     def __init__(self):
         super(YearFixerPlugin, self).__init__()
@@ -21,5 +32,65 @@ class YearFixerPlugin(BeetsPlugin):
         source = ConfigSource(load_yaml(config_file_path) or {}, config_file_path)
         self.config.add(source)
 
+        # ids of the imported or modified items waiting to be fixed (ordered, without duplicates)
+        self.pending_item_ids = {}
+
+        if self.config["auto"].get(bool):
+            self.register_listener('item_imported', self.on_item_imported)
+            self.register_listener('album_imported', self.on_album_imported)
+            self.register_listener('database_change', self.on_database_change)
+            self.register_listener('import', self.on_import)
+            self.register_listener('cli_exit', self.on_cli_exit)
+
     def commands(self):
-        return [YearFixerCommand(self.config)]
+        self.command = YearFixerCommand(self.config)
+        return [self.command, YearFixerIndexCommand(self.config)]
+
+    def on_item_imported(self, lib: Library, item: Item):
+        self.queue_item(item)
+
+    def on_album_imported(self, lib: Library, album: Album):
+        for item in album.items():
+            self.queue_item(item)
+
+    def on_database_change(self, lib: Library, model):
+        if isinstance(model, Item):
+            self.queue_item(model)
+
+    def on_import(self, lib: Library, paths):
+        self.fix_pending_items(lib)
+
+    def on_cli_exit(self, lib: Library):
+        self.fix_pending_items(lib)
+
+    def queue_item(self, item: Item):
+        if self.command and self.command.busy:
+            # changes made by the plugin itself
+            return
+
+        if item.id and not all(is_valid_year(item.get(field)) for field in common.YEAR_FIELDS):
+            self.pending_item_ids[item.id] = True
+
+    def fix_pending_items(self, lib: Library):
+        """Fixes the queued items using the items of their own albums for the means."""
+        item_ids = list(self.pending_item_ids)
+        self.pending_item_ids.clear()
+
+        items = [item for item in map(lib.get_item, item_ids)
+                 if item and not all(is_valid_year(item.get(field)) for field in common.YEAR_FIELDS)]
+        if not items:
+            return
+
+        context_items = {}
+        album_ids = set()
+        for item in items:
+            if item.album_id and item.album_id not in album_ids:
+                album_ids.add(item.album_id)
+                album = item.get_album()
+                context_items.update((album_item.id, album_item) for album_item in (album.items() if album else []))
+            context_items.setdefault(item.id, item)
+
+        common.say("Fixing {} new or modified items.".format(len(items)), log_only=False)
+        if not self.command:
+            self.command = YearFixerCommand(self.config)
+        self.command.handle_items(lib, items, context_items.values())
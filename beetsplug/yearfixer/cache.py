@@ -0,0 +1,66 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+import sqlite3
+import time
+
+
+class LookupCache:
+    """Persistent cache of the years found on MusicBrainz, keyed by lookup key.
+
+    Entries without a year (not found or no dated release) are negative entries and
+    expire after `negative_ttl` seconds, all the others after `ttl` seconds. When the
+    cache holds more than `max_entries` entries the least recently used ones are evicted.
+
+    The cache can be shared by several processes (e.g. the workers of --jobs): each
+    statement is committed right away so that no lock is held between the calls.
+    """
+
+    def __init__(self, path, ttl, negative_ttl, max_entries, timeout=30.0):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS lookups ("
+                           "key TEXT PRIMARY KEY, year INTEGER, fetched REAL, accessed REAL"
+                           ") WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lookups_by_access ON lookups (accessed)")
+
+    def get(self, key):
+        """Returns a tuple (hit, year)."""
+        row = self._conn.execute("SELECT year, fetched FROM lookups WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return False, None
+
+        year, fetched = row
+        now = time.time()
+        ttl = self.ttl if year else self.negative_ttl
+        if fetched + ttl < now:
+            self._conn.execute("DELETE FROM lookups WHERE key = ?", (key,))
+            return False, None
+
+        self._conn.execute("UPDATE lookups SET accessed = ? WHERE key = ?", (now, key))
+        return True, year
+
+    def set(self, key, year):
+        now = time.time()
+        self._conn.execute("INSERT OR REPLACE INTO lookups (key, year, fetched, accessed) VALUES (?, ?, ?, ?)",
+                           (key, year, now, now))
+
+    def evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute("DELETE FROM lookups WHERE key IN "
+                               "(SELECT key FROM lookups ORDER BY accessed LIMIT ?)", (excess,))
+
+    def close(self):
+        self.evict()
+        self._conn.close()
@@ -0,0 +1,73 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import os
+
+from beets.library import Item
+
+from beetsplug.yearfixer import common
+
+CHANGESET_FORMAT = 1
+
+
+class ChangesetError(Exception):
+    """Raised when a changeset file cannot be read."""
+
+
+class ChangesetWriter:
+    """Writes the changes planned by a run, one JSON object per changed item.
+
+    The first line is a header holding the format version and the query of the run. Each
+    following line holds the id and path of an item, its old and new `year` and
+    `original_year`, where each new value comes from and the lookup made for it.
+    """
+
+    def __init__(self, path, **header):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+        header["changeset"] = CHANGESET_FORMAT
+        self._write_line(header)
+
+    def record(self, item: Item, old_values, sources, lookup=None):
+        self._write_line({
+            "id": item.id,
+            "path": os.fsdecode(item.path) if item.path else None,
+            "old": old_values,
+            "new": {field: item.get(field) for field in common.YEAR_FIELDS},
+            "source": sources,
+            "lookup": lookup,
+        })
+        self.count += 1
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write_line(self, record):
+        self._file.write(json.dumps(record) + "\n")
+
+
+def read_changeset(path):
+    """Yields the changes recorded in a changeset file."""
+    with open(path, encoding="utf-8") as changeset:
+        try:
+            header = json.loads(next(changeset))
+        except (StopIteration, ValueError):
+            header = {}
+        if header.get("changeset") != CHANGESET_FORMAT:
+            raise ChangesetError("Not a changeset file: {}".format(path))
+
+        for number, line in enumerate(changeset, 2):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                raise ChangesetError("Invalid change on line {} of {}".format(number, path))
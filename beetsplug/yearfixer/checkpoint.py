@@ -0,0 +1,99 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import hashlib
+import json
+import os
+
+
+def get_run_signature(**params):
+    dump = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(dump.encode("utf-8")).hexdigest()
+
+
+class CheckpointJournal:
+    """Append-only journal of the items processed by a run.
+
+    The first line holds the signature of the run (query, options and mode). Each following
+    line records one processed item and its outcome. Records are buffered and only
+    written by `flush`, which is called once the corresponding items have been committed
+    to the library.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature
+        self.done_ids = set()
+        self.stale = False
+        self._buffer = []
+        self._file = None
+
+    def open(self, resume=False):
+        """Opens the journal. When resuming, returns the number of items already done."""
+        if resume and os.path.isfile(self.path):
+            self._load()
+
+        if self.done_ids:
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write_line({"signature": self.signature})
+            self._sync()
+
+        return len(self.done_ids)
+
+    def is_done(self, item_id):
+        return item_id in self.done_ids
+
+    def record(self, item_id, **outcome):
+        outcome["id"] = item_id
+        self._buffer.append(outcome)
+
+    def flush(self):
+        if not self._file or not self._buffer:
+            return
+
+        for record in self._buffer:
+            self._write_line(record)
+        self._buffer = []
+        self._sync()
+
+    def close(self, completed=False):
+        if not self._file:
+            return
+
+        self.flush()
+        self._file.close()
+        self._file = None
+        if completed:
+            os.remove(self.path)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as journal:
+            lines = iter(journal)
+            try:
+                header = json.loads(next(lines))
+            except (StopIteration, ValueError):
+                header = {}
+
+            if header.get("signature") != self.signature:
+                self.stale = True
+                return
+
+            for line in lines:
+                try:
+                    self.done_ids.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    # a partially written last line
+                    continue
+
+    def _write_line(self, record):
+        self._file.write(json.dumps(record) + "\n")
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
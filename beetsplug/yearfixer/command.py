@@ -4,27 +4,93 @@
 #  Created: 3/27/20, 3:52 PM
 #  License: See LICENSE.txt
 
+import os
 import time
+from collections import Counter, OrderedDict
+from itertools import chain
 from optparse import OptionParser
+from typing import TYPE_CHECKING
 
-import requests
 from beets.dbcore.query import NumericQuery, MatchQuery, AndQuery, OrQuery, NoneQuery
-from beets.library import Library, Item, parse_query_parts
-from beets.ui import Subcommand, decargs
+from beets.library import Library, Item, Album, parse_query_parts
+from beets.ui import Subcommand, UserError, decargs
 from confuse import Subview
 from beetsplug.yearfixer import common
 
+# beets loads the plugin and builds its commands on every invocation: the modules doing
+# the actual work (and their dependencies, e.g. requests) are imported when they are used
+if TYPE_CHECKING:
+    from beetsplug.yearfixer.cache import LookupCache
+    from beetsplug.yearfixer.changeset import ChangesetWriter
+    from beetsplug.yearfixer.checkpoint import CheckpointJournal
+    from beetsplug.yearfixer.means import MeanIndex
+    from beetsplug.yearfixer.musicbrainz import MusicBrainzClient, ArtistCatalogue
+    from beetsplug.yearfixer.offline import OfflineIndex
+    from beetsplug.yearfixer.pipeline import Prefetcher, OrderedWriter
+    from beetsplug.yearfixer.providers import ProviderChain
+    from beetsplug.yearfixer.records import ItemRecord
+    from beetsplug.yearfixer.stats import RunStats
+
 
 class YearFixerCommand(Subcommand):
     config: Subview = None
     lib: Library = None
     query = None
     parser: OptionParser = None
+    mean_index: "MeanIndex" = None
+    cache: "LookupCache" = None
+    counters: Counter = None
+    stats: "RunStats" = None
+    mb_client: "MusicBrainzClient" = None
+    prefetcher: "Prefetcher" = None
+    writer: "OrderedWriter" = None
+    journal: "CheckpointJournal" = None
+    changeset: "ChangesetWriter" = None
+    lookup_memo: OrderedDict = None
+    offline_index: "OfflineIndex" = None
+    providers: "ProviderChain" = None
+    lookup_paths: dict = None
+    album_lookup_path = None
+    artist_track_counts: Counter = None
+    artist_catalogues: OrderedDict = None
+    final_pass = False
+    # set while the command changes the library, so that its own changes are not queued by the listeners
+    busy = False
+    store_batch: list = None
+    last_commit = 0.0
+    # in a worker process of --jobs: the outcome and the changes of each item by id, stored by the parent
+    shard_results: OrderedDict = None
 
     cfg_force = False
+    cfg_cache = True
+    cfg_refresh_cache = False
+    cfg_workers = 1
+    cfg_jobs = 1
+    cfg_write = True
+    cfg_page_size = 0
+    cfg_resume = False
+    cfg_offline = False
+    cfg_since_last_run = False
+    cfg_prefetch_artists = False
+    cfg_local_only = False
+    cfg_per_album = False
+    cfg_dry_run = False
+    cfg_plan = None
+    cfg_apply = None
+    cfg_stats = False
+    cfg_report = None
+    cfg_profile = None
 
     def __init__(self, cfg):
         self.config = cfg
+        self.cfg_cache = self.config["cache"]["enabled"].get(bool)
+        self.cfg_workers = self.config["workers"].get(int)
+        self.cfg_jobs = self.config["jobs"].get(int)
+        self.cfg_write = self.config["write"].get(bool)
+        self.cfg_page_size = self.config["page_size"].get(int)
+        self.cfg_prefetch_artists = self.config["prefetch"]["artists"].get(bool)
+        self.cfg_since_last_run = self.config["since_last_run"].get(bool)
+        self.cfg_per_album = self.config["per_album"].get(bool)
 
         self.parser = OptionParser(usage='beet {plg} [options] [QUERY...]'.format(
             plg=common.plg_ns['__PLUGIN_NAME__']
@@ -36,6 +102,134 @@ class YearFixerCommand(Subcommand):
             help=u'[default: {}] force analysis of items with non-zero original_year values'.format(self.cfg_force)
         )
 
+        self.parser.add_option(
+            '--page-size',
+            action='store', dest='page_size', type='int', default=self.cfg_page_size,
+            help=u'[default: {}] process the library in pages of this many items (0 = all at once)'.format(
+                self.cfg_page_size)
+        )
+
+        self.parser.add_option(
+            '--resume',
+            action='store_true', dest='resume', default=self.cfg_resume,
+            help=u'[default: {}] resume an interrupted run skipping the items it has already processed'.format(
+                self.cfg_resume)
+        )
+
+        self.parser.add_option(
+            '--since-last-run',
+            action='store_true', dest='since_last_run', default=self.cfg_since_last_run,
+            help=u'[default: {}] skip the items checked by a previous run and not modified since, '
+                 u'unresolved items are retried after `retry_after_days`'.format(self.cfg_since_last_run)
+        )
+
+        self.parser.add_option(
+            '--offline',
+            action='store_true', dest='offline', default=self.cfg_offline,
+            help=u'[default: {}] resolve the items from the offline index built by `{}-index` '
+                 u'instead of querying MusicBrainz'.format(self.cfg_offline, common.plg_ns['__PLUGIN_NAME__'])
+        )
+
+        self.parser.add_option(
+            '--prefetch-artists',
+            action='store_true', dest='prefetch_artists', default=self.cfg_prefetch_artists,
+            help=u'[default: {}] fetch the recordings of artists with many selected items in a few paged requests'
+            .format(self.cfg_prefetch_artists)
+        )
+
+        self.parser.add_option(
+            '--local-only',
+            action='store_true', dest='local_only', default=self.cfg_local_only,
+            help=u'[default: {}] only apply the album and artist means, calculated and applied in a few SQL '
+                 u'statements, without MusicBrainz lookups'.format(self.cfg_local_only)
+        )
+
+        self.parser.add_option(
+            '--per-album',
+            action='store_true', dest='per_album', default=self.cfg_per_album,
+            help=u'[default: {}] resolve the years once per album and set them on the album and on its tracks '
+                 u'missing them (on all of them with --force)'.format(self.cfg_per_album)
+        )
+
+        self.parser.add_option(
+            '--dry-run',
+            action='store_true', dest='dry_run', default=self.cfg_dry_run,
+            help=u'[default: {}] with --local-only, only show the changes that would be made (not supported by the '
+                 u'other modes, see --plan)'.format(self.cfg_dry_run)
+        )
+
+        self.parser.add_option(
+            '--plan',
+            action='store', dest='plan', default=self.cfg_plan, metavar='FILE',
+            help=u'resolve the items and write the planned changes to this file without changing the library '
+                 u'or the files'
+        )
+
+        self.parser.add_option(
+            '--apply',
+            action='store', dest='apply', default=self.cfg_apply, metavar='FILE',
+            help=u'apply the changes planned with --plan'
+        )
+
+        self.parser.add_option(
+            '--no-cache',
+            action='store_false', dest='cache', default=self.cfg_cache,
+            help=u'[default: {}] do not use the MusicBrainz lookup cache'.format(not self.cfg_cache)
+        )
+
+        self.parser.add_option(
+            '--refresh-cache',
+            action='store_true', dest='refresh_cache', default=self.cfg_refresh_cache,
+            help=u'[default: {}] ignore cached MusicBrainz lookups and store fresh ones'.format(
+                self.cfg_refresh_cache)
+        )
+
+        self.parser.add_option(
+            '-w', '--workers',
+            action='store', dest='workers', type='int', default=self.cfg_workers,
+            help=u'[default: {}] number of threads used for MusicBrainz lookups and for writing tags'.format(
+                self.cfg_workers)
+        )
+
+        self.parser.add_option(
+            '-j', '--jobs',
+            action='store', dest='jobs', type='int', default=self.cfg_jobs,
+            help=u'[default: {}] number of processes fixing the items, each with its own share of the albums '
+                 u'and artists'.format(self.cfg_jobs)
+        )
+
+        self.parser.add_option(
+            '--no-write',
+            action='store_false', dest='write', default=self.cfg_write,
+            help=u'[default: {}] only update the library, the changes are written to the files by --flush-writes'
+            .format(not self.cfg_write)
+        )
+
+        self.parser.add_option(
+            '--flush-writes',
+            action='store_true', dest='flush_writes', default=False,
+            help=u'write the changes not yet written to the files (by --no-write or failed writes)'
+        )
+
+        self.parser.add_option(
+            '--stats',
+            action='store_true', dest='stats', default=self.cfg_stats,
+            help=u'[default: {}] show the counters and the timings of each stage at the end of the run'.format(
+                self.cfg_stats)
+        )
+
+        self.parser.add_option(
+            '--report',
+            action='store', dest='report', default=self.cfg_report, metavar='FILE',
+            help=u'write the counters and the timings of the run to this JSON file'
+        )
+
+        self.parser.add_option(
+            '--profile',
+            action='store', dest='profile', default=self.cfg_profile, metavar='FILE',
+            help=u'profile the run and write the cProfile data to this file'
+        )
+
         self.parser.add_option(
             '-v', '--version',
             action='store_true', dest='version', default=False,
@@ -54,54 +248,911 @@ class YearFixerCommand(Subcommand):
         self.lib = lib
         self.query = decargs(arguments)
         self.cfg_force = options.force
+        self.cfg_cache = options.cache
+        self.cfg_refresh_cache = options.refresh_cache
+        self.cfg_workers = max(1, options.workers)
+        self.cfg_jobs = max(1, options.jobs)
+        self.cfg_write = options.write
+        self.cfg_page_size = max(0, options.page_size)
+        self.cfg_resume = options.resume
+        self.cfg_offline = options.offline
+        self.cfg_since_last_run = options.since_last_run
+        self.cfg_prefetch_artists = options.prefetch_artists
+        self.cfg_local_only = options.local_only
+        self.cfg_per_album = options.per_album
+        self.cfg_dry_run = options.dry_run
+        self.cfg_plan = options.plan
+        self.cfg_apply = options.apply
+        self.cfg_stats = options.stats
+        self.cfg_report = options.report
+        self.cfg_profile = options.profile
 
         if options.version:
             self.show_version_information()
             return
 
-        self.handle_main_task()
+        self.check_options(options)
+
+        from beetsplug.yearfixer.stats import RunStats
+
+        self.counters = Counter()
+        self.stats = RunStats(self.counters)
+        if options.flush_writes:
+            task = self.handle_flush_writes
+        elif self.cfg_apply:
+            task = self.handle_apply
+        elif self.cfg_local_only:
+            task = self.handle_local_only
+        elif self.cfg_per_album:
+            task = self.handle_per_album
+        elif self.cfg_jobs > 1 and not self.cfg_plan:
+            task = self.handle_jobs
+        else:
+            task = self.handle_main_task
+
+        self.busy = True
+        try:
+            if self.cfg_profile:
+                self.run_profiled(task)
+            else:
+                task()
+        finally:
+            self.busy = False
+            self.show_stats()
+
+    def check_options(self, options):
+        """Rejects the combinations of options which would not do what they say."""
+        if self.cfg_dry_run and not self.cfg_local_only:
+            raise UserError("--dry-run can only be used with --local-only, use --plan to review the changes of "
+                            "the other modes.")
+        if self.cfg_plan:
+            # the changesets hold the changes of the items only: the album rows of --per-album would not be applied
+            for option, enabled in (("--local-only", self.cfg_local_only), ("--flush-writes", options.flush_writes),
+                                    ("--apply", self.cfg_apply), ("--per-album", self.cfg_per_album)):
+                if enabled:
+                    raise UserError("--plan cannot be used with {}.".format(option))
+
+    def run_profiled(self, task):
+        import cProfile
+        import io
+        import pstats
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(task)
+        finally:
+            profiler.dump_stats(self.cfg_profile)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+            self._say(summary.getvalue())
+            self._say("Profile written to: {}".format(self.cfg_profile), log_only=False)
+
+    def show_stats(self):
+        if self.cfg_stats:
+            for line in self.stats.get_summary_lines():
+                self._say(line, log_only=False)
+
+        if self.cfg_report:
+            self.stats.write_report(self.cfg_report, query=self.query, force=self.cfg_force)
+            self._say("Report written to: {}".format(self.cfg_report), log_only=False)
 
     def handle_main_task(self):
-        items = self.retrieve_library_items()
-        if not items:
+        from beetsplug.yearfixer.changeset import ChangesetWriter
+        from beetsplug.yearfixer.means import MeanIndex
+        from beetsplug.yearfixer.offline import OfflineIndex
+
+        pages = self.retrieve_library_item_pages()
+        first_page = next(pages, None)
+        if first_page is None:
+            self._say("Your query did not produce any results.", log_only=False)
+            return
+
+        self.offline_index = None
+        if self.cfg_offline:
+            index_path = self._get_offline_index_path()
+            if not index_path:
+                return
+            self.offline_index = OfflineIndex(index_path)
+
+        self.mean_index = MeanIndex()
+        with self.stats.timer("means_build"):
+            self.mean_index.build(self.lib)
+        self._start_lookups()
+        if self.cfg_prefetch_artists and not self.offline_index:
+            # without pages, all the selected records are already loaded
+            self.artist_track_counts = self._count_selected_items_by_artist(
+                first_page if not self.cfg_page_size else None)
+        # planning runs change nothing: there is nothing to resume
+        self.journal = self._open_journal() if not self.cfg_plan else None
+        self.changeset = ChangesetWriter(self.cfg_plan, query=self.query, force=self.cfg_force) \
+            if self.cfg_plan else None
+        completed = False
+
+        try:
+            deferred = []
+            for page in chain([first_page], pages):
+                page = (item for item in page if not self._is_done(item) and not self._is_checked(item))
+                deferred += self._fix_items(page)
+                # each page is committed before the next one is fetched
+                self.writer.drain()
+                self._commit_stored_items()
+
+            self._retry_deferred_items(deferred)
+            completed = True
+        finally:
+            self._finish_lookups()
+            if self.changeset:
+                self.changeset.close()
+                self._say("Planned changes of {} items written to: {}".format(
+                    self.changeset.count, self.cfg_plan), log_only=False)
+                self.changeset = None
+            if self.journal:
+                self.journal.close(completed)
+                if not completed:
+                    self._say("Run interrupted. Use --resume to continue it.", log_only=False)
+
+    def handle_per_album(self):
+        """Fixes the selected albums. The years are resolved once per album and set on the tracks missing them.
+
+        The values are resolved by the providers of each field, asked for the whole album
+        (see `ProviderChain.resolve_album`). The changed tracks and the album are stored in
+        a single transaction once their files are written. The selected items which are
+        not in an album are then fixed one by one.
+        """
+        from beetsplug.yearfixer.means import MeanIndex
+        from beetsplug.yearfixer.offline import OfflineIndex
+
+        ignored = [option for option, enabled in (("--jobs", self.cfg_jobs > 1), ("--page-size", self.cfg_page_size),
+                                                  ("--since-last-run", self.cfg_since_last_run)) if enabled]
+        if ignored:
+            self._say("Ignoring {} with --per-album.".format(", ".join(ignored)), log_only=False)
+            self.cfg_since_last_run = False
+
+        albums = self.retrieve_library_albums()
+        full_query, ordering = self.get_selection_query()
+        singletons = self._load_records(AndQuery([full_query, NoneQuery("album_id")]), ordering)
+        if not albums and not singletons:
             self._say("Your query did not produce any results.", log_only=False)
             return
 
+        self.offline_index = None
+        if self.cfg_offline:
+            index_path = self._get_offline_index_path()
+            if not index_path:
+                return
+            self.offline_index = OfflineIndex(index_path)
+
+        self.mean_index = MeanIndex()
+        with self.stats.timer("means_build"):
+            self.mean_index.build(self.lib)
+        self._start_lookups(item_written=self._mark_written)
+        self.journal = self._open_journal()
+        completed = False
+
+        try:
+            for album in albums:
+                self.fix_album(album)
+            self._fix_singletons(singletons)
+            completed = True
+        finally:
+            self._finish_lookups()
+            self.journal.close(completed)
+            if not completed:
+                self._say("Run interrupted. Use --resume to continue it.", log_only=False)
+
+    def _fix_singletons(self, records):
+        """Fixes the selected items which are not in an album one by one, as the main task does."""
+        records = [record for record in records if not self._is_done(record)]
+        if not records:
+            return
+
+        self._say("Fixing {} items not in an album.".format(len(records)), log_only=False)
+        # unlike the tracks of the albums, the items are stored in batches once written
+        self.writer.close()
+        self._start_writer()
+        self._retry_deferred_items(self._fix_items(records))
+
+    def fix_album(self, album: Album):
+        """Sets the values resolved for the album on the album and on its tracks missing them (all with --force)."""
+        from beetsplug.yearfixer.means import is_valid_year
+
+        items = list(album.items())
+        if all(self._is_done(item) for item in items):
+            return
+
+        with self.stats.timer("resolve"):
+            values, _, lookup_path = self.process_album(album, items)
+        self.counters["albums_seen"] += 1
+
+        changed = []
         for item in items:
-            self.process_item(item)
-            item.try_write()
-            item.store()
+            old_values = {field: item.get(field) for field in common.YEAR_FIELDS}
+            for field, value in values.items():
+                if self.cfg_force or not is_valid_year(item.get(field)):
+                    item[field] = value
+
+            changed_fields = self.get_changed_fields(item, old_values)
+            self.counters["items_seen"] += 1
+            self.counters["items_changed" if changed_fields else "items_unchanged"] += 1
+            for field in changed_fields:
+                self.mean_index.update(item, field, old_values[field], item.get(field))
+
+            if not changed_fields:
+                self._record_done(item, changed=False)
+            else:
+                # only the tracks whose original year comes from the lookup record it
+                if lookup_path and "original_year" in changed_fields:
+                    item[common.LOOKUP_PATH_ATTR] = lookup_path
+                    self.lookup_paths[item.id] = lookup_path
+                self._mark_checked(item, changed=True)
+                changed.append(item)
+
+        if changed:
+            self.counters["albums_changed"] += 1
+
+        for field, value in values.items():
+            if self.cfg_force or not is_valid_year(album.get(field)):
+                album[field] = value
+        for item in changed:
+            self.writer.submit(item)
+        self.writer.drain()
+
+        with self.stats.timer("store"), self.lib.transaction():
+            for item in changed:
+                item.store()
+            # the tracks are stored above: skip Album.store, which stores them all again
+            super(Album, album).store()
+        if self.journal:
+            self.journal.flush()
+
+    def process_album(self, album: Album, items):
+        """Returns the values of the year fields for the tracks of the album, where they come from and the
+        lookup which gave the `original_year` (None if it does not come from a lookup). Only the fields
+        missing on some of the tracks are resolved (all of them with --force).
+        """
+        from beetsplug.yearfixer.means import is_valid_year, get_mean_year
+
+        self._say("Fixing album: {}".format(album), log_only=True)
+        needed = [field for field in common.YEAR_FIELDS
+                  if self.cfg_force or not all(is_valid_year(item.get(field)) for item in items)]
+        values, sources = {}, {}
+        self.album_lookup_path = None
+
+        for field in needed:
+            value, source = self.providers.resolve_album(album, items, field)
+            if value:
+                self._say("Got ({}) `{}`: {}".format(source, field, value))
+                values[field], sources[field] = value, source
+
+        for field, other in (("year", "original_year"), ("original_year", "year")):
+            if field in needed and field not in values:
+                value = values.get(other) or get_mean_year(item.get(other) for item in items)
+                if value:
+                    values[field], sources[field] = value, other
+
+        for field in needed:
+            self._count_source(field, sources.get(field))
+        if not values:
+            self._say("Cannot find info!")
+
+        lookup_path = self.album_lookup_path if sources.get("original_year") in ("cache", "musicbrainz") else None
+        return values, sources, lookup_path
+
+    def _get_known_release_group_year(self, album: Album, negative=True):
+        """Returns (known, year) from the earlier lookups of the release group of the album, made by this run or
+        cached. Release groups known to have no year are only reported as known with `negative`.
+        """
+        mb_releasegroupid = album.get("mb_releasegroupid")
+        if not mb_releasegroupid or self.offline_index:
+            # the offline index has no release groups
+            return False, None
+
+        key = "release-group\t{}".format(mb_releasegroupid)
+        if key in self.lookup_memo and (negative or self.lookup_memo[key]):
+            self.lookup_memo.move_to_end(key)
+            self.counters["lookups_deduplicated"] += 1
+            self._set_album_lookup_path("memo")
+            return True, self.lookup_memo[key]
+
+        if self.cache and not self.cfg_refresh_cache:
+            hit, year = self.cache.get(key)
+            if hit and (negative or year):
+                self.counters["cache_hits"] += 1
+                self._memoize(key, year)
+                self._set_album_lookup_path("cache")
+                return True, year
+            if negative:
+                self.counters["cache_misses"] += 1
+
+        return False, None
+
+    def _get_release_group_year(self, album: Album):
+        """Returns the first release date of the release group of the album."""
+        known, year = self._get_known_release_group_year(album)
+        if known or not album.get("mb_releasegroupid") or self.offline_index:
+            return year
+
+        mb_releasegroupid = album.get("mb_releasegroupid")
+        key = "release-group\t{}".format(mb_releasegroupid)
+        url = common.get_mb_release_group_url(mb_releasegroupid, self.mb_client.base_url)
+        with self.stats.timer("musicbrainz"):
+            data = self.mb_client.get_json(url, defer=False)
+
+        # as for recordings: 404s (None) are cached as negative entries, failures ({}) are not cached
+        year = common.extract_original_year_from_recording(data) if data else None
+        if data != {}:
+            self._memoize(key, year)
+            if self.cache:
+                self.cache.set(key, year)
+        self._set_album_lookup_path("release-group")
+
+        return year
+
+    def _set_album_lookup_path(self, path):
+        self.album_lookup_path = path
+        self.counters["lookup_path_{}".format(path)] += 1
+
+    def handle_items(self, lib: Library, items, context_items):
+        """Fixes the given items (e.g. those just imported) outside of a command run.
+
+        The album and artist means are taken from `context_items` only, usually the
+        albums the items belong to, so the library is not scanned.
+        """
+        from beetsplug.yearfixer.means import MeanIndex
+        from beetsplug.yearfixer.stats import RunStats
+
+        self.lib = lib
+        self.query = []
+        self.counters = Counter()
+        self.stats = RunStats(self.counters)
+        self.mean_index = MeanIndex()
+        self.mean_index.add_items(context_items)
+        self.offline_index = None
+        self.journal = None
+        self._start_lookups()
+
+        self.busy = True
+        try:
+            self._retry_deferred_items(self._fix_items(items))
+        finally:
+            try:
+                self._finish_lookups()
+            finally:
+                self.busy = False
+
+    def handle_jobs(self):
+        """Fixes the selection in `cfg_jobs` worker processes, each with a shard of the albums and artists.
+
+        The workers look up the items and resolve their years. The tags are written by this
+        process, with the beets configuration and plugins of the run, as are the changes to
+        the library: the results are stored as each shard finishes.
+        """
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from beetsplug.yearfixer.jobs import ShardTask, get_shards, run_shard
+
+        if self.lib.path == ":memory:":
+            self._say("--jobs needs a library stored in a file.", log_only=False, is_error=True)
+            return
+        if self.cfg_offline and not self._get_offline_index_path():
+            return
+
+        self.journal = self._open_journal()
+        self.lookup_paths = {}
+        self._start_writer()
+        completed = False
+        try:
+            items = (item for page in self.retrieve_library_item_pages() for item in page
+                     if not self._is_done(item) and not self._is_checked(item))
+            shards = get_shards(items, self.cfg_jobs)
+            if not shards:
+                self._say("Your query did not produce any results.", log_only=False)
+                completed = True
+                return
+
+            config = self._get_worker_config(len(shards))
+            options = {name: value for name, value in vars(self).items() if name.startswith("cfg_")}
+            options["query"] = self.query
+            self._say("Fixing {} items in {} processes.".format(sum(map(len, shards)), len(shards)), log_only=False)
+
+            # spawned workers do not inherit the connections and the threads of this process
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(len(shards), mp_context=context) as pool:
+                futures = [pool.submit(run_shard, ShardTask(os.fsdecode(self.lib.path), os.fsdecode(self.lib.directory),
+                                                            config, options, shard)) for shard in shards]
+                try:
+                    for future in as_completed(futures):
+                        results, counters, stages = future.result()
+                        self.stats.merge(counters, stages)
+                        self._store_shard_results(results)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+            completed = True
+        finally:
+            try:
+                self._finish_writer()
+            finally:
+                self.journal.close(completed)
+                if not completed:
+                    self._say("Run interrupted. Use --resume to continue it.", log_only=False)
+
+    def _get_worker_config(self, jobs):
+        config = self.config.flatten()
+        # the workers do not load the beets configuration: the paths are resolved here
+        config["cache"]["path"] = common.get_data_file_path(self.config["cache"]["path"], "yearfixer_cache.db")
+        config["offline"]["index"] = common.get_data_file_path(self.config["offline"]["index"],
+                                                               "yearfixer_offline.db")
+        if self.config["providers"]["year_map"].get():
+            config["providers"]["year_map"] = self.config["providers"]["year_map"].as_filename()
+        # the rate limit is shared by the workers
+        config["musicbrainz"]["rate_limit"] = self.config["musicbrainz"]["rate_limit"].as_number() / jobs
+
+        return config
+
+    def _store_shard_results(self, results):
+        """Stores the results of a shard. The changed items go through the writer, which stores them once written."""
+        written = []
+        with self.stats.timer("store"), self.lib.transaction():
+            for item_id, result in results.items():
+                item = self.lib.get_item(item_id) if result.changes else None
+                if item:
+                    for field, value in result.changes.items():
+                        if value is not None:
+                            item[field] = value
+                        elif field in item:
+                            del item[field]
+                    if result.write:
+                        self.lookup_paths[item_id] = result.outcome["lookup"]
+                        written.append(item)
+                        continue
+                    item.store()
+                if self.journal:
+                    # changed items removed from the library meanwhile are recorded as unchanged
+                    outcome = dict(result.outcome, changed=False) if result.write else result.outcome
+                    self.journal.record(item_id, **outcome)
+        self._say("Committed {} items.".format(len(results) - len(written)))
+
+        for item in written:
+            self.writer.submit(item)
+        self._commit_stored_items()
+
+    def handle_shard(self, lib: Library, item_ids):
+        """Fixes a shard of the selection in a worker process of --jobs. Returns (results, counters, stages).
+
+        Neither the tags nor the library are written here: `results` holds a `ShardResult`
+        for each item by id, for the parent process to write and store the items.
+        """
+        from beetsplug.yearfixer.means import MeanIndex
+        from beetsplug.yearfixer.offline import OfflineIndex
+        from beetsplug.yearfixer.records import load_item_records_by_id
+        from beetsplug.yearfixer.stats import RunStats
+
+        self.lib = lib
+        self.counters = Counter()
+        self.stats = RunStats(self.counters)
+        self.shard_results = OrderedDict()
+        self.journal = None
+        self.offline_index = OfflineIndex(self._get_offline_index_path()) if self.cfg_offline else None
+        self.mean_index = MeanIndex()
+        with self.stats.timer("means_build"):
+            self.mean_index.build(lib)
+
+        # the items were selected by the parent process: the query is not run again
+        items = load_item_records_by_id(lib, item_ids, with_markers=self.cfg_since_last_run)
+        self._start_lookups()
+        if self.cfg_prefetch_artists and not self.offline_index:
+            # all the items of an artist are in the same shard
+            self.artist_track_counts = Counter(item.get("mb_artistid") for item in items)
+
+        try:
+            self._retry_deferred_items(self._fix_items(items))
+        finally:
+            self._finish_lookups()
+
+        return self.shard_results, self.counters, self.stats.stages
+
+    def _get_offline_index_path(self):
+        """Returns the path of the offline index, None if it was not built."""
+        index_path = common.get_data_file_path(self.config["offline"]["index"], "yearfixer_offline.db")
+        if not os.path.isfile(index_path):
+            self._say("Offline index not found: {}. Build it with `beet {}-index DUMP_FILE`.".format(
+                index_path, common.plg_ns['__PLUGIN_NAME__']), log_only=False, is_error=True)
+            return None
+
+        return index_path
+
+    def _start_lookups(self, item_written=None):
+        from beetsplug.yearfixer.musicbrainz import MusicBrainzClient
+        from beetsplug.yearfixer.pipeline import Prefetcher
+
+        self.cache = self._open_cache() if self.cfg_cache and not self.offline_index else None
+        self.mb_client = MusicBrainzClient(self.config["musicbrainz"], self.stats, self.cfg_workers)
+        self.final_pass = False
+
+        # Lookups run ahead of the resolution of the items, which happens in selection
+        # order in this thread, and tags are written in parallel while the database is
+        # updated in selection order - the results are the same as with a single worker
+        window = 2 * self.cfg_workers
+        self.prefetcher = Prefetcher(self._lookup_mb_year, self._get_prefetch_key, self.cfg_workers, window)
+        self.lookup_memo = OrderedDict()
+        self.lookup_paths = {}
+        self.artist_catalogues = OrderedDict()
+        self.artist_track_counts = Counter()
+        self.providers = self._get_provider_chain()
+        self._start_writer(item_written)
+
+    def _get_provider_chain(self):
+        from beetsplug.yearfixer.providers import ProviderChain, CacheProvider, MusicBrainzProvider, \
+            MeanProvider, AlbumMeanProvider, YearMapProvider, get_provider_names
+        from confuse import ConfigValueError
+
+        cfg = self.config["providers"]
+        min_items = cfg["min_mean_items"].get(int)
+        available = {
+            "cache": CacheProvider(self._get_known_year, self._get_known_release_group_year),
+            "musicbrainz": MusicBrainzProvider(self._get_mb_year, self._get_release_group_year),
+            "album_mean": AlbumMeanProvider(self.mean_index, min_items),
+            "artist_mean": MeanProvider("artist_mean", self.mean_index, "mb_artistid", min_items),
+        }
+        if cfg["year_map"].get():
+            path = cfg["year_map"].as_filename()
+            if not os.path.isfile(path):
+                raise ConfigValueError("providers.year_map: file not found: {}".format(path))
+            available["year_map"] = YearMapProvider(path)
+
+        # the year map is only asked when a file is configured
+        return ProviderChain({field: [available[name] for name in get_provider_names(cfg, field) if name in available]
+                              for field in common.YEAR_FIELDS}, self.stats)
+
+    def _fix_items(self, items):
+        """Fixes the items in order. Returns the items whose lookups were deferred."""
+        deferred = []
+        for item in self.prefetcher.iterate(items):
+            try:
+                self.fix_item(item)
+            except common.LookupDeferred:
+                deferred.append(item)
+
+        return deferred
+
+    def _retry_deferred_items(self, deferred):
+        if not deferred:
+            return
+
+        self._say("Retrying {} deferred items.".format(len(deferred)), log_only=False)
+        self.final_pass = True
+        for item in deferred:
+            self.fix_item(item)
+
+    def _finish_lookups(self):
+        self.prefetcher.close()
+        try:
+            self._finish_writer()
+        finally:
+            self.providers.close()
+            self.mb_client.close()
+            if self.offline_index:
+                self.offline_index.close()
+            if self.cache:
+                self.cache.close()
+                self._say("Cache hits: {}, misses: {}".format(
+                    self.counters["cache_hits"], self.counters["cache_misses"]), log_only=False)
+            self._say("Lookups of duplicate recordings saved: {}".format(
+                self.counters["lookups_deduplicated"]), log_only=False)
+            self._say("Lookup paths: {}".format(", ".join(
+                "{}: {}".format(name[len("lookup_path_"):], count)
+                for name, count in sorted(self.counters.items()) if name.startswith("lookup_path_")
+            ) or "none"), log_only=False)
+
+    def handle_local_only(self):
+        from beetsplug.yearfixer.local import LocalPass
+
+        full_query, _ = self.get_selection_query()
+        where, subvals = full_query.clause()
+
+        with self.stats.timer("local_pass"), self.lib.transaction() as tx:
+            local_pass = LocalPass(tx, self.cfg_force)
+            try:
+                if where is None:
+                    # the query cannot be run in SQL
+                    local_pass.select_ids(item.id for item in self.lib.items(full_query))
+                else:
+                    local_pass.select(where, subvals)
+                self.counters["items_seen"] = local_pass.count_selected()
+                self.counters["items_changed"] = changed = local_pass.compute()
+
+                if self.cfg_dry_run:
+                    for item_id, artist, album, title, *values in local_pass.get_changes():
+                        self._say("{} - {} - {}: year: {} -> {}, original_year: {} -> {}".format(
+                            artist, album, title, *values), log_only=False)
+                else:
+                    local_pass.apply(common.PENDING_WRITE_ATTR)
+            finally:
+                local_pass.close()
+
+        if self.cfg_dry_run:
+            self._say("{} items would be changed.".format(changed), log_only=False)
+            return
+
+        self._say("Changed {} items.".format(changed), log_only=False)
+        if self.cfg_write and changed:
+            self.handle_flush_writes()
+
+    def handle_apply(self):
+        """Applies a changeset. Items changed since it was planned are skipped."""
+        from beetsplug.yearfixer.changeset import ChangesetError, read_changeset
+
+        self.journal = None
+        self._start_writer()
+        applied = 0
+        try:
+            for change in read_changeset(self.cfg_apply):
+                item = self.lib.get_item(change["id"])
+                if not self._can_apply(item, change):
+                    self.counters["changes_conflicting"] += 1
+                    continue
+
+                for field, value in change["new"].items():
+                    item[field] = value
+                if change.get("lookup"):
+                    item[common.LOOKUP_PATH_ATTR] = change["lookup"]
+                self.writer.submit(item)
+                applied += 1
+        except ChangesetError as err:
+            self._say(err, log_only=False, is_error=True)
+        finally:
+            self._finish_writer()
+
+        self.counters["changes_applied"] = applied
+        self._say("Applied the changes of {} items, skipped {} items changed since the plan.".format(
+            applied, self.counters["changes_conflicting"]), log_only=False)
+
+    @staticmethod
+    def _can_apply(item: Item, change):
+        if not item or (change.get("path") and os.fsdecode(item.path) != change["path"]):
+            return False
+
+        return all(item.get(field) == value for field, value in change["old"].items())
+
+    def handle_flush_writes(self):
+        parsed_cmd_query, parsed_ordering = parse_query_parts(self.query, Item)
+        full_query = AndQuery([parsed_cmd_query, NumericQuery(common.PENDING_WRITE_ATTR, '1', fast=False)])
+        self._say("Selection query: {}".format(full_query))
+
+        self.cfg_write = True
+        self.journal = None
+        self._start_writer()
+        count = 0
+        try:
+            for item in self.lib.items(full_query, parsed_ordering):
+                self.writer.submit(item)
+                count += 1
+        finally:
+            self._finish_writer()
+
+        self._say("Flushed pending writes of {} items.".format(count), log_only=False)
+
+    def fix_item(self, item: "Item | ItemRecord"):
+        old_values = {field: item.get(field) for field in common.YEAR_FIELDS}
+        with self.stats.timer("resolve"):
+            sources = self.process_item(item)
+        self.counters["items_seen"] += 1
+
+        changed_fields = self.get_changed_fields(item, old_values)
+        self.counters["items_changed" if changed_fields else "items_unchanged"] += 1
+        for field in changed_fields:
+            self.mean_index.update(item, field, old_values[field], item.get(field))
+
+        if changed_fields or (self.cfg_since_last_run and not self.changeset):
+            record, item = item, self._load_item(item)
+            if item is None:
+                # removed from the library during the run
+                self._record_done(record, changed=False)
+                return
+
+        lookup_path = self.lookup_paths.get(item.id)
+        if self.changeset and changed_fields:
+            self.changeset.record(item, old_values, sources or {}, lookup_path)
+            self._record_done(item, changed=True)
+        elif changed_fields:
+            if lookup_path:
+                item[common.LOOKUP_PATH_ATTR] = lookup_path
+            self._mark_checked(item, changed=True)
+            if self.shard_results is not None:
+                # in a worker process: the parent process writes the tags
+                from beetsplug.yearfixer.jobs import get_item_changes
+
+                self._add_shard_result(item, get_item_changes(item), True, changed=True)
+            else:
+                self.writer.submit(item)
+        elif self.cfg_since_last_run and not self.changeset:
+            # only the markers are stored
+            self._mark_checked(item, changed=False)
+            self._record_done(item, changed=False)
+            self._store_item(item)
+        else:
+            self._record_done(item, changed=False)
+
+    def _load_item(self, record: "Item | ItemRecord"):
+        """Returns the full item of a record (None if it was removed), with the values fixed on the record."""
+        if isinstance(record, Item):
+            return record
+
+        with self.stats.timer("load"):
+            item = self.lib.get_item(record.id)
+        if item:
+            self.counters["items_loaded"] += 1
+            for field in common.YEAR_FIELDS:
+                item[field] = record.get(field)
+
+        return item
+
+    @staticmethod
+    def _mark_checked(item: Item, changed):
+        from beetsplug.yearfixer.means import is_valid_year
+
+        if not all(is_valid_year(item.get(field)) for field in common.YEAR_FIELDS):
+            outcome = "unresolved"
+        else:
+            outcome = "fixed" if changed else "unchanged"
+        item[common.CHECKED_ATTR] = time.time()
+        item[common.OUTCOME_ATTR] = outcome
+        item[common.MTIME_ATTR] = item.get("mtime")
+
+    def _is_checked(self, item: Item):
+        """Whether the item was checked by a previous run and is not to be checked again yet."""
+        if not self.cfg_since_last_run or common.CHECKED_ATTR not in item:
+            return False
+
+        # the mtime goes through a text column: compare it to the millisecond
+        if abs(float(item.get(common.MTIME_ATTR) or 0) - float(item.get("mtime") or 0)) > 0.001:
+            return False
+
+        retry_after = self.config["retry_after_days"].as_number() * 86400
+        age = time.time() - float(item.get(common.CHECKED_ATTR))
+        if item.get(common.OUTCOME_ATTR) == "unresolved" and age >= retry_after:
+            return False
+
+        self.counters["skipped_checked"] += 1
+        return True
+
+    def _open_journal(self):
+        from beetsplug.yearfixer.checkpoint import CheckpointJournal, get_run_signature
+
+        path = common.get_data_file_path(self.config["checkpoint"]["path"], "yearfixer_checkpoint.jsonl")
+
+        # a run of another mode selects and records different items
+        signature = get_run_signature(query=self.query, force=self.cfg_force, per_album=self.cfg_per_album,
+                                      local_only=self.cfg_local_only, since_last_run=self.cfg_since_last_run)
+        journal = CheckpointJournal(path, signature)
+        done = journal.open(resume=self.cfg_resume)
+        if journal.stale:
+            self._say("The checkpoint was made by a run with a different query, options or mode. Starting over.",
+                      log_only=False)
+        elif self.cfg_resume:
+            self._say("Resuming: skipping {} items already processed.".format(done), log_only=False)
+
+        return journal
+
+    def _is_done(self, item: Item):
+        if self.journal and self.journal.is_done(item.id):
+            self.counters["skipped"] += 1
+            return True
+        return False
+
+    def _record_done(self, item: Item, **outcome):
+        if self.shard_results is not None:
+            self._add_shard_result(item, {}, False, **outcome)
+            return
+
+        lookup_path = self.lookup_paths.pop(item.id, None) if self.lookup_paths else None
+        if self.journal:
+            self.journal.record(item.id, year=item.get("year"), original_year=item.get("original_year"),
+                                lookup=lookup_path, **outcome)
+
+    def _add_shard_result(self, item: Item, changes, write, **outcome):
+        """In a worker process: keeps the outcome and the changes of the item for the parent process."""
+        from beetsplug.yearfixer.jobs import ShardResult
+
+        lookup_path = self.lookup_paths.pop(item.id, None)
+        self.shard_results[item.id] = ShardResult(
+            dict(outcome, year=item.get("year"), original_year=item.get("original_year"), lookup=lookup_path),
+            changes, write)
+
+    @staticmethod
+    def get_changed_fields(item: Item, old_values):
+        return [field for field, old_value in old_values.items() if item.get(field) != old_value]
+
+    def _start_writer(self, item_written=None):
+        from beetsplug.yearfixer.pipeline import OrderedWriter
+
+        window = 2 * self.cfg_workers
+        self.writer = OrderedWriter(self._write_item, item_written or self._item_written, self.cfg_workers, window)
+        self.store_batch = []
+        self.last_commit = time.monotonic()
+
+    def _finish_writer(self):
+        try:
+            self.writer.close()
+        finally:
+            self._commit_stored_items()
+
+    def _write_item(self, item: Item):
+        """Runs in a writer thread. Returns whether the file holds the new values."""
+        if not self.cfg_write:
+            return False
+
+        with self.stats.timer("write"):
+            return item.try_write()
+
+    def _item_written(self, item: Item, written):
+        self._mark_written(item, written)
+        self._store_item(item)
+
+    def _mark_written(self, item: Item, written):
+        if written:
+            if common.PENDING_WRITE_ATTR in item:
+                del item[common.PENDING_WRITE_ATTR]
+            if common.CHECKED_ATTR in item:
+                # writing the file updates the mtime of the item: it was not modified by anyone else
+                item[common.MTIME_ATTR] = item.get("mtime")
+        else:
+            item[common.PENDING_WRITE_ATTR] = 1
+
+        self._record_done(item, changed=True, written=bool(written))
+
+    def _store_item(self, item: Item):
+        """Items are stored in batches, each batch in a single transaction."""
+        if self.shard_results is not None:
+            # in a worker process: the parent process stores the changes
+            from beetsplug.yearfixer.jobs import get_item_changes
+
+            self.shard_results[item.id].changes.update(get_item_changes(item))
+            return
+
+        self.store_batch.append(item)
+
+        batch_size = self.config["batch_size"].get(int)
+        commit_interval = self.config["commit_interval"].as_number()
+        if len(self.store_batch) >= batch_size or time.monotonic() - self.last_commit >= commit_interval:
+            self._commit_stored_items()
+
+    def _commit_stored_items(self):
+        if self.store_batch:
+            with self.stats.timer("store"), self.lib.transaction():
+                for item in self.store_batch:
+                    item.store()
+            self._say("Committed {} items.".format(len(self.store_batch)))
+        if self.journal:
+            self.journal.flush()
+        self.store_batch = []
+        self.last_commit = time.monotonic()
 
     def process_item(self, item: Item):
+        """Fixes the year fields of the item. Returns where the new values come from by field."""
         self._say("Fixing item: {}".format(item), log_only=True)
 
         year = item.get("year")
         original_year = item.get("original_year")
+        sources = {}
 
         if not original_year or self.cfg_force:
-            mbdata = self._get_mb_data(item)
-            if mbdata:
-                extracted = common.extract_original_year_from_mb_data(mbdata)
-                if extracted:
-                    original_year = extracted
-                    self._say("Got (MusicBrainz) recording `original_year`: {}"
-                              .format(original_year))
-
-            if not original_year:
-                original_year = self.get_mean_value_for_album(item, "original_year")
-                self._say("Got (mean-album) `original_year`: {}".format(original_year))
-
-            if not original_year:
-                original_year = self.get_mean_value_for_artist(item, "original_year")
-                self._say("Got (mean-artist) `original_year`: {}".format(original_year))
+            value, source = self.providers.resolve(item, "original_year", current=original_year)
+            if value:
+                original_year = value
+                self._say("Got ({}) `original_year`: {}".format(source, original_year))
+
+            self._count_source("original_year", source if original_year else None)
+            sources["original_year"] = source
 
         if not year or self.cfg_force:
-            year = self.get_mean_value_for_album(item, "year")
-            self._say("Got (mean-album) `year`: {}".format(year))
+            year, source = self.providers.resolve(item, "year")
+            self._say("Got ({}) `year`: {}".format(source, year))
 
-            if not year:
-                year = self.get_mean_value_for_artist(item, "year")
-                self._say("Got (mean-artist) `year`: {}".format(year))
+            self._count_source("year", source if year else None)
+            sources["year"] = source
 
         if original_year:
             setattr(item, "original_year", original_year)
@@ -111,123 +1162,289 @@ class YearFixerCommand(Subcommand):
 
         if original_year and not year:
             setattr(item, "year", original_year)
+            sources["year"] = "original_year"
 
         if year and not original_year:
             setattr(item, "original_year", year)
+            sources["original_year"] = "year"
 
         if not year and not original_year:
             self._say("Cannot find info!")
 
-    def get_mean_value_for_album(self, item: Item, field_name):
-        answer = None
+        return {field: source for field, source in sources.items() if source}
 
-        query = MatchQuery('mb_albumid', item.get("mb_albumid"))
-        items = self.lib.items(query)
-        values = []
-        for it in items:
-            if it.get(field_name):
-                val = int(it.get(field_name))
-                if 0 < val < 2100:
-                    values.append(val)
+    def _count_source(self, field, source):
+        """Counts where the value of a field was found (None if it was not found)."""
+        if source:
+            self.counters["{}_from_{}".format(field, source)] += 1
+        else:
+            self.counters["{}_unresolved".format(field)] += 1
 
-        if values:
-            answer = int(round(sum(values) / len(values)))
+    def _open_cache(self):
+        from beetsplug.yearfixer.cache import LookupCache
 
-        return answer
+        cfg = self.config["cache"]
+        path = common.get_data_file_path(cfg["path"], "yearfixer_cache.db")
 
-    def get_mean_value_for_artist(self, item: Item, field_name):
-        answer = None
+        return LookupCache(path,
+                           ttl=cfg["ttl"].get(int),
+                           negative_ttl=cfg["negative_ttl"].get(int),
+                           max_entries=cfg["max_entries"].get(int))
 
-        query = MatchQuery('mb_artistid', item.get("mb_artistid"))
-        items = self.lib.items(query)
-        values = []
-        for it in items:
-            if it.get(field_name):
-                val = int(it.get(field_name))
-                if 0 < val < 2100:
-                    values.append(val)
+    def _get_prefetch_key(self, item: Item):
+        if self.offline_index or (item.get("original_year") and not self.cfg_force):
+            return None
 
-        if values:
-            answer = int(round(sum(values) / len(values)))
+        key = common.get_lookup_key(item)
+        if not key or key in self.lookup_memo:
+            return None
+        if self.cache and not self.cfg_refresh_cache and self.cache.get(key)[0]:
+            return None
+        if self._is_artist_prefetched(item):
+            # resolved from the artist catalogue, looked up one by one only if missing there
+            return None
+        if self.providers.is_settled_before(item, "original_year", "musicbrainz", current=item.get("original_year")):
+            return None
 
-        return answer
+        return key
 
-    def _get_mb_data(self, item: Item):
-        data = {}
+    def _count_selected_items_by_artist(self, records=None):
+        """Returns the number of selected items of each artist, counted on the records of the selection if given."""
+        if records is not None:
+            return Counter(record.mb_artistid for record in records)
 
-        try:
-            url = common.get_mb_search_url(item)
-        except AttributeError as err:
-            self._say(err, is_error=True)
-            return data
+        full_query, _ = self.get_selection_query()
+        where, subvals = full_query.clause()
+        counts = Counter()
 
-        # self._say(u'fetching URL: {}'.format(url))
+        if where is None:
+            # the query cannot be run in SQL: the pages of records are read once more
+            for page in self.retrieve_library_item_pages():
+                counts.update(record.mb_artistid for record in page)
+        else:
+            with self.lib.transaction() as tx:
+                sql = "SELECT mb_artistid, COUNT(*) FROM items WHERE {} GROUP BY mb_artistid".format(where)
+                for mb_artistid, count in tx.query(sql, subvals):
+                    counts[mb_artistid] = count
 
-        headers = {
-            'User-Agent': '{pt}/{ver} ( {url} )'.format(
-                pt=common.plg_ns['__PACKAGE_TITLE__'],
-                ver=common.plg_ns['__version__'],
-                url=common.plg_ns['__PACKAGE_URL__'],
-            ),
-        }
+        return counts
 
-        max_retries = 5
-        sleep_time = 3
-        retries = 0
+    def _is_artist_prefetched(self, item: Item):
+        mb_artistid = item.get("mb_artistid")
+        if not mb_artistid or self.artist_track_counts[mb_artistid] < self.config["prefetch"]["min_tracks"].get(int):
+            return False
 
-        while not data:
-            retries += 1
-            # self._say('Retry #{}'.format(retries))
-            if retries > max_retries:
-                self._say("Maximum({}) retries reached. Abandoning.".format(max_retries), is_error=True)
-                break
+        # artists whose catalogue could not be fetched are stored with None
+        return self.artist_catalogues.get(mb_artistid, True) is not None
 
-            try:
-                res = requests.get(url, headers=headers)
-            except requests.RequestException as err:
-                self._say(err, is_error=True)
-                break
-
-            if res.status_code == 503:
-                # we hit the query limit -
-                # https://musicbrainz.org/doc/XML_Web_Service/Rate_Limiting
-                self._say('Retry #{} - Query LIMIT Hit! sleeping {}s.'
-                          .format(retries, sleep_time))
-                time.sleep(sleep_time)
-                continue
-
-            if res.status_code == 404:
-                self._say('404 - Not found.', is_error=True)
-                break
+    def _get_artist_catalogue(self, item: Item) -> "ArtistCatalogue":
+        if not self._is_artist_prefetched(item):
+            return None
 
-            try:
-                data = res.json()
-            except ValueError as err:
-                self._say('Invalid Response: {}'.format(err), is_error=True)
-                break
+        mb_artistid = item.get("mb_artistid")
+        if mb_artistid in self.artist_catalogues:
+            self.artist_catalogues.move_to_end(mb_artistid)
+            return self.artist_catalogues[mb_artistid]
 
-        return data
+        # more pages than items would cost more requests than looking up the items one by one
+        max_pages = min(self.config["prefetch"]["max_pages"].get(int), self.artist_track_counts[mb_artistid] - 1)
+        with self.stats.timer("artist_browse"):
+            catalogue = self.mb_client.browse_artist_recordings(mb_artistid, max_pages)
+        self.counters["artists_prefetched" if catalogue else "artists_not_prefetched"] += 1
 
-    def retrieve_library_items(self):
+        self.artist_catalogues[mb_artistid] = catalogue
+        if len(self.artist_catalogues) > self.config["prefetch"]["cache_size"].get(int):
+            self.artist_catalogues.popitem(last=False)
+
+        return catalogue
+
+    def _get_mb_year(self, item: Item):
+        """Resolves each lookup key once per run, copies of the same recording reuse the result.
+
+        The lookup path used for the item is kept in `lookup_paths`.
+        """
+        if self.offline_index:
+            self._set_lookup_path(item, "offline")
+            return self.offline_index.lookup(item)
+
+        known, year = self._get_known_year(item)
+        if known:
+            return year
+
+        key = common.get_lookup_key(item)
+        catalogue = self._get_artist_catalogue(item)
+        year = catalogue.lookup(item) if catalogue else None
+        if year:
+            cacheable, path = True, "artist"
+        else:
+            future = self.prefetcher.pop(key) if key and not self.final_pass else None
+            year, cacheable, path = future.result() if future else self._lookup_mb_year(item)
+        self._set_lookup_path(item, path)
+
+        if key and cacheable:
+            self._memoize(key, year)
+            if self.cache:
+                self.cache.set(key, year)
+
+        return year
+
+    def _get_known_year(self, item: Item, negative=True):
+        """Returns (known, year) from the earlier lookups of the same recording, made by this run or cached.
+
+        Recordings known to have no year are only reported as known with `negative`.
+        """
+        key = common.get_lookup_key(item)
+        if not key or self.offline_index:
+            return False, None
+
+        if key in self.lookup_memo and (negative or self.lookup_memo[key]):
+            self.lookup_memo.move_to_end(key)
+            self.counters["lookups_deduplicated"] += 1
+            self._set_lookup_path(item, "memo")
+            return True, self.lookup_memo[key]
+
+        if self.cache and not self.cfg_refresh_cache:
+            hit, year = self.cache.get(key)
+            if hit and (negative or year):
+                self.counters["cache_hits"] += 1
+                self._memoize(key, year)
+                self._set_lookup_path(item, "cache")
+                return True, year
+            if negative:
+                # misses are counted once, by the lookup following them
+                self.counters["cache_misses"] += 1
+
+        return False, None
+
+    def _set_lookup_path(self, item: Item, path):
+        self.lookup_paths[item.id] = path
+        self.counters["lookup_path_{}".format(path)] += 1
+
+    def _memoize(self, key, year):
+        self.lookup_memo[key] = year
+        if len(self.lookup_memo) > self.config["lookup_memo_size"].get(int):
+            self.lookup_memo.popitem(last=False)
+
+    def _lookup_mb_year(self, item: Item):
+        """Network part of the lookup, safe to run in a worker thread. Returns (year, cacheable, path)."""
+        with self.stats.timer("musicbrainz"):
+            mbdata, path = self._get_mb_data(item)
+
+        # Transient failures (empty data) are not cacheable, 404s (None) are cached as negative entries
+        if mbdata is None:
+            return None, True, path
+        if not mbdata:
+            return None, False, path
+
+        return common.extract_original_year_from_mb_data(mbdata, self.mb_client.min_score), True, path
+
+    def _get_mb_data(self, item: Item):
+        """Returns a tuple (data, path).
+
+        The data is the decoded response, None if MusicBrainz answered 404 or {} on failure.
+        The recording is fetched directly when the item has a `mb_trackid`, otherwise (or if
+        the recording does not exist anymore) it is searched by artist and title. The path
+        tells which of those lookups were made: `mbid`, `search` or `mbid+search`.
+        """
+        mb_trackid = item.get("mb_trackid")
+        if mb_trackid:
+            url = common.get_mb_recording_url(mb_trackid, self.mb_client.base_url)
+            data = self.mb_client.get_json(url, defer=not self.final_pass)
+            if data is not None:
+                return data, "mbid"
+            self._say("Recording {} not found. Falling back to search.".format(mb_trackid))
+
+        path = "mbid+search" if mb_trackid else "search"
+
+        try:
+            url = common.get_mb_search_url(item, self.mb_client.base_url, self.mb_client.search_limit)
+        except AttributeError as err:
+            self._say(err, is_error=True)
+            return {}, path
+
+        # self._say(u'fetching URL: {}'.format(url))
+
+        return self.mb_client.get_json(url, defer=not self.final_pass), path
+
+    def get_selection_query(self):
         cmd_query = self.query
         parsed_cmd_query, parsed_ordering = parse_query_parts(cmd_query, Item)
 
         if self.cfg_force:
             full_query = parsed_cmd_query
         else:
-            parsed_plg_query = OrQuery([
-                NumericQuery('year', '0'),
-                MatchQuery('year', ''),
-                NoneQuery('year'),
-                NumericQuery('original_year', '0'),
-                MatchQuery('original_year', ''),
-                NoneQuery('original_year'),
-            ])
-            full_query = AndQuery([parsed_cmd_query, parsed_plg_query])
+            full_query = AndQuery([parsed_cmd_query, self.get_missing_years_query()])
 
         self._say("Selection query: {}".format(full_query))
 
-        return self.lib.items(full_query, parsed_ordering)
+        return full_query, parsed_ordering
+
+    @staticmethod
+    def get_missing_years_query():
+        return OrQuery([
+            NumericQuery('year', '0'),
+            MatchQuery('year', ''),
+            NoneQuery('year'),
+            NumericQuery('original_year', '0'),
+            MatchQuery('original_year', ''),
+            NoneQuery('original_year'),
+        ])
+
+    def retrieve_library_albums(self):
+        """Returns the albums matching the query having tracks with missing years (all of them with --force)."""
+        parsed_cmd_query, parsed_ordering = parse_query_parts(self.query, Album)
+        self._say("Selection query: {}".format(parsed_cmd_query))
+        albums = self.lib.albums(parsed_cmd_query, parsed_ordering)
+        if self.cfg_force:
+            return list(albums)
+
+        where, subvals = self.get_missing_years_query().clause()
+        with self.lib.transaction() as tx:
+            rows = tx.query("SELECT DISTINCT album_id FROM items WHERE album_id IS NOT NULL AND {}".format(where),
+                            subvals)
+        album_ids = {row[0] for row in rows}
+
+        return [album for album in albums if album.id in album_ids]
+
+    def retrieve_library_items(self):
+        """Returns the records of the selected items, see `ItemRecord`."""
+        full_query, parsed_ordering = self.get_selection_query()
+
+        return self._load_records(full_query, parsed_ordering)
+
+    def _load_records(self, query, ordering):
+        from beetsplug.yearfixer.records import load_item_records
+
+        return load_item_records(self.lib, query, ordering, with_markers=self.cfg_since_last_run)
+
+    def retrieve_library_item_pages(self):
+        """Yields the records of the selected items in non-empty pages.
+
+        Without a page size all the items are returned in one page. Otherwise the library
+        is walked by ranges of `page_size` item ids and the items are ordered within
+        each page only, so at most one page is held in memory at any time.
+        """
+        if not self.cfg_page_size:
+            items = self.retrieve_library_items()
+            if items:
+                yield items
+            return
+
+        full_query, parsed_ordering = self.get_selection_query()
+        last_id = 0
+        while True:
+            with self.lib.transaction() as tx:
+                rows = tx.query("SELECT MIN(id), MAX(id) FROM "
+                                "(SELECT id FROM items WHERE id > ? ORDER BY id LIMIT ?)",
+                                (last_id, self.cfg_page_size))
+            first_id, last_id = rows[0]
+            if first_id is None:
+                return
+
+            id_range = NumericQuery('id', '{}..{}'.format(first_id, last_id))
+            page = self._load_records(AndQuery([full_query, id_range]), parsed_ordering)
+            if page:
+                yield page
 
     def show_version_information(self):
         self._say("{pt}({pn}) plugin for Beets: v{ver}".format(
@@ -8,20 +8,39 @@ import logging
 import os
 from urllib.parse import quote_plus
 
+from beets import config as beets_config
 from beets.library import Item
+from confuse import Subview
+
+from beetsplug.yearfixer import about
 
 # Get values as: plg_ns['__PLUGIN_NAME__']
-plg_ns = {}
-about_path = os.path.join(os.path.dirname(__file__), u'about.py')
-with open(about_path) as about_file:
-    exec(about_file.read(), plg_ns)
+plg_ns = vars(about)
 
 __logger__ = logging.getLogger('beets.{plg}'.format(plg=plg_ns['__PLUGIN_NAME__']))
 
 MB_BASE = "https://musicbrainz.org/ws/2/"
 
+YEAR_FIELDS = ("year", "original_year")
+
+# Flexible attribute set on items whose new values have not been written to the file yet
+PENDING_WRITE_ATTR = "yearfixer_pending_write"
+
+# Flexible attribute recording how the MusicBrainz lookup of a modified item was made
+LOOKUP_PATH_ATTR = "yearfixer_lookup"
+
+# Flexible attributes recording when an item was last checked, the outcome
+# (fixed, unchanged or unresolved) and the mtime of the item at that time
+CHECKED_ATTR = "yearfixer_checked"
+OUTCOME_ATTR = "yearfixer_outcome"
+MTIME_ATTR = "yearfixer_mtime"
 
-def get_mb_search_url(item: Item):
+
+class LookupDeferred(Exception):
+    """Raised when a MusicBrainz lookup keeps failing and should be retried later."""
+
+
+def get_mb_search_url(item: Item, base=MB_BASE, limit=None):
     mb_artistid = item.get("mb_artistid")
     title = item.get("title")
 
@@ -29,31 +48,108 @@ def get_mb_search_url(item: Item):
         raise AttributeError("Missing tag(mb_artistid or title)! Cannot build MB url.")
 
     query = 'arid:{arid} AND recording:"{title}"'.format(arid=mb_artistid, title=title)
-    url = "{base}recording/?query={qry}&fmt={fmt}".format(base=MB_BASE, qry=query, fmt="json")
+    url = "{base}recording/?query={qry}&fmt={fmt}".format(base=base, qry=query, fmt="json")
+    if limit:
+        url += "&limit={}".format(limit)
 
     return quote_plus(url, safe=':/&?=')
 
 
-def extract_original_year_from_mb_data(data):
+def get_mb_recording_url(mb_trackid, base=MB_BASE):
+    url = "{base}recording/{mbid}?inc={inc}&fmt={fmt}".format(
+        base=base, mbid=quote_plus(mb_trackid), inc="releases", fmt="json")
+
+    return url
+
+
+def get_mb_release_group_url(mb_releasegroupid, base=MB_BASE):
+    url = "{base}release-group/{mbid}?fmt={fmt}".format(base=base, mbid=quote_plus(mb_releasegroupid), fmt="json")
+
+    return url
+
+
+def get_mb_browse_url(mb_artistid, offset, limit, base=MB_BASE):
+    url = "{base}recording?artist={arid}&offset={offset}&limit={limit}&fmt={fmt}".format(
+        base=base, arid=quote_plus(mb_artistid), offset=offset, limit=limit, fmt="json")
+
+    return url
+
+
+def normalize_title(title):
+    return " ".join(title.casefold().split())
+
+
+def get_lookup_key(item: Item):
+    mb_trackid = item.get("mb_trackid")
+    if mb_trackid:
+        return "recording\t{mbid}".format(mbid=mb_trackid)
+
+    return make_lookup_key(item.get("mb_artistid"), item.get("title"))
+
+
+def make_lookup_key(mb_artistid, title):
+    if not mb_artistid or not title:
+        return None
+
+    return "{arid}\t{title}".format(arid=mb_artistid, title=normalize_title(title))
+
+
+def extract_original_year_from_mb_data(data, min_score=0):
     answer = None
 
     if "recordings" in data.keys():
+        # search results are sorted by score: the rest are weaker matches
         for recording in data["recordings"]:
-            if "releases" in recording.keys():
-                for release in recording["releases"]:
-                    if "date" in release.keys():
-                        try:
-                            # date should be formatted: yyyy-mm-dd (mm and dd might be missing)
-                            rel_year = int(release["date"][:4])
-                        except ValueError:
-                            continue
-                        except AttributeError:
-                            continue
-                        answer = rel_year if not answer or rel_year < answer else answer
+            if get_recording_score(recording) < min_score:
+                break
+            answer = extract_original_year_from_recording(recording, answer)
+    elif "releases" in data.keys():
+        # a single recording looked up by its id
+        answer = extract_original_year_from_recording(data)
+
+    return answer
+
+
+def get_recording_score(recording):
+    try:
+        return int(recording.get("score", 100))
+    except (ValueError, TypeError):
+        return 0
+
+
+def extract_original_year_from_recording(recording, answer=None):
+    if recording.get("first-release-date"):
+        try:
+            first_year = int(recording["first-release-date"][:4])
+        except (ValueError, TypeError):
+            first_year = None
+        if first_year:
+            # the first release date is the earliest of all releases: no need to walk them
+            return first_year if not answer or first_year < answer else answer
+
+    if "releases" in recording.keys():
+        for release in recording["releases"]:
+            if "date" in release.keys():
+                try:
+                    # date should be formatted: yyyy-mm-dd (mm and dd might be missing)
+                    rel_year = int(release["date"][:4])
+                except ValueError:
+                    continue
+                except AttributeError:
+                    continue
+                answer = rel_year if not answer or rel_year < answer else answer
 
     return answer
 
 
+def get_data_file_path(view: Subview, default_name):
+    """Returns the path configured in `view` or the default file in the beets configuration directory."""
+    if view.get():
+        return view.as_filename()
+
+    return os.path.join(beets_config.config_dir(), default_name)
+
+
 def say(msg, log_only=True, is_error=False):
     _level = logging.DEBUG
     _level = _level if log_only else logging.INFO
@@ -0,0 +1,55 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+from optparse import OptionParser
+
+from beets.library import Library
+from beets.ui import Subcommand
+from confuse import Subview
+
+from beetsplug.yearfixer import common
+
+
+class YearFixerIndexCommand(Subcommand):
+    config: Subview = None
+    parser: OptionParser = None
+
+    def __init__(self, cfg):
+        self.config = cfg
+
+        self.parser = OptionParser(usage='beet {plg}-index [options] DUMP_FILE'.format(
+            plg=common.plg_ns['__PLUGIN_NAME__']
+        ))
+
+        self.parser.add_option(
+            '-o', '--output',
+            action='store', dest='output', default=None,
+            help=u'path of the index file [default: the configured `offline.index`]'
+        )
+
+        # Keep this at the end
+        super(YearFixerIndexCommand, self).__init__(
+            parser=self.parser,
+            name='{plg}-index'.format(plg=common.plg_ns['__PLUGIN_NAME__']),
+            help=u'build the offline year index from a MusicBrainz recording dump (JSON lines or TSV)'
+        )
+
+    def func(self, lib: Library, options, arguments):
+        from beetsplug.yearfixer.offline import OfflineIndex
+
+        if len(arguments) != 1 or not os.path.isfile(arguments[0]):
+            self._say("Please specify an existing MusicBrainz dump file.", log_only=False, is_error=True)
+            return
+
+        path = options.output or common.get_data_file_path(self.config["offline"]["index"], "yearfixer_offline.db")
+        self._say("Building offline index: {}".format(path), log_only=False)
+        count = OfflineIndex.build(arguments[0], path)
+        self._say("Indexed {} recordings.".format(count), log_only=False)
+
+    @staticmethod
+    def _say(msg, log_only=True, is_error=False):
+        common.say(msg, log_only, is_error)
@@ -0,0 +1,79 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from collections import namedtuple
+
+from beets.library import Library, Item
+from confuse import RootView, ConfigSource
+
+from beetsplug.yearfixer import common
+
+# What a worker process needs to fix its shard: the library is opened again by the worker
+ShardTask = namedtuple("ShardTask", ["library_path", "directory", "config", "options", "item_ids"])
+
+# What a worker process found for one item: the outcome to record in the journal, the
+# changed fields and whether the tags are to be written (by the parent process)
+ShardResult = namedtuple("ShardResult", ["outcome", "changes", "write"])
+
+# The fields a worker process changes on an item
+CHANGED_FIELDS = common.YEAR_FIELDS + (common.LOOKUP_PATH_ATTR, common.CHECKED_ATTR, common.OUTCOME_ATTR,
+                                       common.MTIME_ATTR)
+
+
+def get_shards(items, jobs):
+    """Splits the items into at most `jobs` lists of ids, keeping the order of the items.
+
+    Items sharing an album or an artist (directly or through other items) end up in the
+    same shard, so the album and artist means of each shard only change with its own
+    items - as in a run without shards. Groups are spread over the shards largest first.
+    """
+    parents = {}
+
+    def find(node):
+        root = node
+        while parents.setdefault(root, root) != root:
+            root = parents[root]
+        while parents[node] != root:
+            parents[node], node = root, parents[node]
+        return root
+
+    selected = []
+    for item in items:
+        album, artist = ("mb_albumid", item.get("mb_albumid")), ("mb_artistid", item.get("mb_artistid"))
+        parents[find(album)] = find(artist)
+        selected.append((item.id, album))
+
+    groups = {}
+    for position, (item_id, album) in enumerate(selected):
+        groups.setdefault(find(album), []).append((position, item_id))
+
+    shards = [[] for _ in range(max(1, jobs))]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+
+    return [[item_id for _, item_id in sorted(shard)] for shard in shards if shard]
+
+
+def run_shard(task: ShardTask):
+    """Worker process entry point. Returns (results, counters, stages) of the shard.
+
+    The worker only resolves the years of its items: it neither writes the tags nor the
+    library. The results are returned to the parent process, which has loaded the beets
+    configuration and plugins, to write the tags and store the items.
+    """
+    from beetsplug.yearfixer.command import YearFixerCommand
+
+    command = YearFixerCommand(RootView([ConfigSource.of(task.config)]))
+    for option, value in task.options.items():
+        setattr(command, option, value)
+
+    # the connection is closed with the worker process
+    return command.handle_shard(Library(task.library_path, task.directory), task.item_ids)
+
+
+def get_item_changes(item: Item):
+    """Returns the values of the fields a worker process may have changed on the item (None if not set)."""
+    return {field: item.get(field) if field in item else None for field in CHANGED_FIELDS}
@@ -0,0 +1,98 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.dbcore.db import Transaction
+
+from beetsplug.yearfixer.means import MIN_VALID_YEAR, MAX_VALID_YEAR
+
+_VALID_VALUE = "CASE WHEN {f} > {min} AND {f} < {max} THEN {f} END"
+
+# int(round(total / count)) in integer arithmetic: Python rounds halves to the even number
+_ROUNDED_MEAN = "CASE WHEN {c} = 0 THEN NULL ELSE {s} / {c} + " \
+                "(CASE WHEN 2 * ({s} % {c}) > {c} OR (2 * ({s} % {c}) = {c} AND ({s} / {c}) % 2 = 1) " \
+                "THEN 1 ELSE 0 END) END"
+
+
+class LocalPass:
+    """The album and artist mean fallbacks applied to a whole selection in a few SQL statements.
+
+    The means are calculated from the library as it is before the pass, whereas the item
+    by item run updates them after each fixed item. The statements use temporary tables
+    on the connection of the transaction, which are dropped by `close`.
+    """
+
+    GROUP_TABLES = (("mb_albumid", "yearfixer_album_means"), ("mb_artistid", "yearfixer_artist_means"))
+
+    def __init__(self, tx: Transaction, force=False):
+        self.tx = tx
+        self.force = force
+        self.tx.mutate("CREATE TEMP TABLE yearfixer_selection (id INTEGER PRIMARY KEY)")
+        self.tx.mutate("CREATE TEMP TABLE yearfixer_changes (id INTEGER PRIMARY KEY, "
+                       "old_year, new_year, old_original_year, new_original_year)")
+        for _, table in self.GROUP_TABLES:
+            self.tx.mutate("CREATE TEMP TABLE {} (group_value PRIMARY KEY, year, original_year)".format(table))
+
+    def select(self, where, subvals):
+        self.tx.mutate("INSERT INTO temp.yearfixer_selection SELECT id FROM items WHERE {}".format(where), subvals)
+
+    def select_ids(self, item_ids):
+        for item_id in item_ids:
+            self.tx.mutate("INSERT INTO temp.yearfixer_selection VALUES (?)", (item_id,))
+
+    def compute(self):
+        """Calculates the means and the new values of the selected items. Returns the number of changed items."""
+        for group_field, table in self.GROUP_TABLES:
+            sums = ", ".join("SUM({v}) AS {f}_sum, COUNT({v}) AS {f}_count".format(
+                v=_VALID_VALUE.format(f=field, min=MIN_VALID_YEAR, max=MAX_VALID_YEAR), f=field)
+                for field in ("year", "original_year"))
+            means = ", ".join(_ROUNDED_MEAN.format(s="{}_sum".format(field), c="{}_count".format(field))
+                              for field in ("year", "original_year"))
+            self.tx.mutate("INSERT INTO temp.{t} SELECT group_value, {m} FROM "
+                           "(SELECT {g} AS group_value, {s} FROM items GROUP BY {g})"
+                           .format(t=table, g=group_field, s=sums, m=means))
+
+        # the same fallbacks as YearFixerCommand.process_item without MusicBrainz data
+        self.tx.mutate(
+            "INSERT INTO temp.yearfixer_changes "
+            "SELECT id, old_year, COALESCE(y, oy, old_year), old_original_year, COALESCE(oy, y, old_original_year) "
+            "FROM (SELECT i.id AS id, i.year AS old_year, i.original_year AS old_original_year, "
+            "      COALESCE(NULLIF(i.original_year, 0), al.original_year, ar.original_year) AS oy, "
+            "      COALESCE(CASE WHEN ? THEN NULL ELSE NULLIF(i.year, 0) END, al.year, ar.year) AS y "
+            "      FROM temp.yearfixer_selection s JOIN items i ON i.id = s.id "
+            "      LEFT JOIN temp.yearfixer_album_means al ON al.group_value = i.mb_albumid "
+            "      LEFT JOIN temp.yearfixer_artist_means ar ON ar.group_value = i.mb_artistid) "
+            "WHERE COALESCE(y, oy, old_year) IS NOT old_year "
+            "   OR COALESCE(oy, y, old_original_year) IS NOT old_original_year",
+            (self.force,))
+
+        return self.tx.query("SELECT COUNT(*) FROM temp.yearfixer_changes")[0][0]
+
+    def count_selected(self):
+        return self.tx.query("SELECT COUNT(*) FROM temp.yearfixer_selection")[0][0]
+
+    def get_changes(self):
+        """Returns the changed items as rows of
+        (id, artist, album, title, old_year, new_year, old_original_year, new_original_year).
+        """
+        return self.tx.query(
+            "SELECT c.id, i.artist, i.album, i.title, c.old_year, c.new_year, c.old_original_year, "
+            "c.new_original_year FROM temp.yearfixer_changes c JOIN items i ON i.id = c.id ORDER BY c.id")
+
+    def apply(self, flag_attr=None):
+        """Updates the changed items with one statement and sets the `flag_attr` flexible attribute on them."""
+        self.tx.mutate(
+            "UPDATE items SET "
+            "year = (SELECT new_year FROM temp.yearfixer_changes c WHERE c.id = items.id), "
+            "original_year = (SELECT new_original_year FROM temp.yearfixer_changes c WHERE c.id = items.id) "
+            "WHERE id IN (SELECT id FROM temp.yearfixer_changes)")
+
+        if flag_attr:
+            self.tx.mutate("INSERT INTO item_attributes (entity_id, key, value) "
+                           "SELECT id, ?, 1 FROM temp.yearfixer_changes", (flag_attr,))
+
+    def close(self):
+        for table in ("yearfixer_selection", "yearfixer_changes") + tuple(t for _, t in self.GROUP_TABLES):
+            self.tx.mutate("DROP TABLE IF EXISTS temp.{}".format(table))
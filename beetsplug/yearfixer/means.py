@@ -0,0 +1,84 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.library import Library, Item
+
+GROUP_FIELDS = ('mb_albumid', 'mb_artistid')
+VALUE_FIELDS = ('year', 'original_year')
+
+MIN_VALID_YEAR = 0
+MAX_VALID_YEAR = 2100
+
+
+def is_valid_year(value):
+    return bool(value) and MIN_VALID_YEAR < int(value) < MAX_VALID_YEAR
+
+
+def get_mean_year(values):
+    """Returns the rounded mean of the valid years among the values (None if there are none)."""
+    years = [int(value) for value in values if is_valid_year(value)]
+
+    return int(round(sum(years) / len(years))) if years else None
+
+
+class MeanIndex:
+    """Running sums and counts of the year fields grouped by album and by artist.
+
+    The index is built with one grouped query per (group, field) pair and is then kept
+    up to date by calling `update` every time an item gets new year values, so the means
+    are the same as those obtained by querying the library after each stored item.
+    """
+
+    def __init__(self):
+        # (group_field, group_value, value_field) -> [sum, count]
+        self._data = {}
+
+    def build(self, lib: Library):
+        self._data = {}
+        with lib.transaction() as tx:
+            for group_field in GROUP_FIELDS:
+                for value_field in VALUE_FIELDS:
+                    sql = "SELECT {g}, SUM({f}), COUNT({f}) FROM items " \
+                          "WHERE {f} > ? AND {f} < ? GROUP BY {g}" \
+                        .format(g=group_field, f=value_field)
+                    for group_value, total, count in tx.query(sql, (MIN_VALID_YEAR, MAX_VALID_YEAR)):
+                        self._data[(group_field, group_value, value_field)] = [total, count]
+
+    def add_items(self, items):
+        """Adds the values of the given items only, e.g. those of the albums being imported."""
+        for item in items:
+            for value_field in VALUE_FIELDS:
+                self._add(item, value_field, item.get(value_field), 1)
+
+    def mean(self, group_field, group_value, value_field):
+        entry = self._data.get((group_field, group_value, value_field))
+        if not entry or not entry[1]:
+            return None
+
+        return int(round(entry[0] / entry[1]))
+
+    def count(self, group_field, group_value, value_field):
+        """Returns the number of items the mean is calculated from."""
+        entry = self._data.get((group_field, group_value, value_field))
+
+        return entry[1] if entry else 0
+
+    def update(self, item: Item, value_field, old_value, new_value):
+        if old_value == new_value:
+            return
+
+        self._add(item, value_field, old_value, -1)
+        self._add(item, value_field, new_value, 1)
+
+    def _add(self, item: Item, value_field, value, sign):
+        if not is_valid_year(value):
+            return
+
+        for group_field in GROUP_FIELDS:
+            key = (group_field, item.get(group_field), value_field)
+            entry = self._data.setdefault(key, [0, 0])
+            entry[0] += sign * int(value)
+            entry[1] += sign
@@ -0,0 +1,162 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import math
+
+import requests
+from beets.library import Item
+from confuse import Subview
+from requests.adapters import HTTPAdapter
+
+from beetsplug.yearfixer import common, ratelimit
+from beetsplug.yearfixer.ratelimit import TokenBucket
+from beetsplug.yearfixer.stats import RunStats
+
+
+class ArtistCatalogue:
+    """Earliest years of the recordings of one artist by recording id and normalized title."""
+
+    def __init__(self):
+        self.by_mbid = {}
+        self.by_title = {}
+
+    def add(self, recording):
+        year = common.extract_original_year_from_recording(recording)
+        if not year:
+            return
+
+        self.by_mbid[recording.get("id")] = year
+        title = common.normalize_title(recording.get("title") or "")
+        if title not in self.by_title or year < self.by_title[title]:
+            self.by_title[title] = year
+
+    def lookup(self, item: Item):
+        year = self.by_mbid.get(item.get("mb_trackid"))
+        if not year and item.get("title"):
+            year = self.by_title.get(common.normalize_title(item.get("title")))
+
+        return year
+
+
+class MusicBrainzClient:
+    """Long-lived, rate limited HTTP client for the MusicBrainz web service.
+
+    All requests go through one pooled keep-alive session. The client is used from the
+    prefetch threads: requests and retries are counted through the thread-safe `RunStats.count`.
+    """
+
+    def __init__(self, cfg: Subview, stats: RunStats = None, min_pool_size=1):
+        self.base_url = cfg["base_url"].as_str().rstrip("/") + "/"
+        self.timeout = (cfg["connect_timeout"].as_number(), cfg["read_timeout"].as_number())
+        self.max_retries = cfg["max_retries"].get(int)
+        self.backoff_base = cfg["backoff_base"].as_number()
+        self.backoff_max = cfg["backoff_max"].as_number()
+        self.search_limit = cfg["search_limit"].get(int)
+        self.min_score = cfg["min_score"].get(int)
+        self.stats = stats if stats is not None else RunStats()
+        self.rate_limiter = TokenBucket(cfg["rate_limit"].as_number(), cfg["burst"].get(int))
+
+        pool_size = max(cfg["pool_size"].get(int), min_pool_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = '{pt}/{ver} ( {url} )'.format(
+            pt=common.plg_ns['__PACKAGE_TITLE__'],
+            ver=common.plg_ns['__version__'],
+            url=common.plg_ns['__PACKAGE_URL__'],
+        )
+
+    def get_json(self, url, defer=True):
+        """Returns the decoded response, None if MusicBrainz answered 404 or {} on failure.
+
+        When all retries fail LookupDeferred is raised, unless `defer` is False.
+        """
+        data = {}
+        attempt = 0
+
+        while True:
+            attempt += 1
+            if attempt > self.max_retries:
+                if not defer:
+                    self._say("Maximum({}) retries reached. Abandoning.".format(self.max_retries), is_error=True)
+                    return data
+                self._say("Maximum({}) retries reached. Deferring item.".format(self.max_retries))
+                raise common.LookupDeferred(url)
+
+            backoff = ratelimit.get_backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+            self.rate_limiter.acquire()
+            self.stats.count("requests")
+            try:
+                res = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as err:
+                self._say(err, is_error=True)
+                self.rate_limiter.pause(backoff)
+                continue
+
+            server_delay = ratelimit.get_server_delay(res.headers)
+
+            if res.status_code == 503 or res.status_code == 429 or res.status_code >= 500:
+                # we hit the query limit -
+                # https://musicbrainz.org/doc/XML_Web_Service/Rate_Limiting
+                delay = server_delay if server_delay is not None else backoff
+                self.stats.count("retries")
+                self._say('Retry #{} - Query LIMIT Hit! pausing {:.2f}s.'.format(attempt, delay))
+                self.rate_limiter.pause(delay)
+                continue
+
+            if server_delay:
+                # no more requests are allowed until the rate limit window resets
+                self.rate_limiter.pause(server_delay)
+
+            if res.status_code == 404:
+                self._say('404 - Not found.', is_error=True)
+                return None
+
+            try:
+                data = res.json()
+            except ValueError as err:
+                self._say('Invalid Response: {}'.format(err), is_error=True)
+
+            return data
+
+    def browse_artist_recordings(self, mb_artistid, max_pages, limit=100):
+        """Returns the ArtistCatalogue of an artist fetched with paged browse requests.
+
+        Returns None if a request failed or if the artist has more than `max_pages` pages
+        of recordings, in which case looking up the items one by one is cheaper. The number
+        of recordings is only known from the first page: it is always fetched (a probe with
+        a smaller limit would cost a request too, and one more for the artists prefetched).
+        """
+        catalogue = ArtistCatalogue()
+        offset = 0
+
+        while True:
+            url = common.get_mb_browse_url(mb_artistid, offset, limit, self.base_url)
+            data = self.get_json(url, defer=False)
+            if not data:
+                return None
+
+            total = data.get("recording-count", 0)
+            if offset == 0 and math.ceil(total / limit) > max_pages:
+                self._say("Artist {} has too many recordings({}) to prefetch.".format(mb_artistid, total))
+                return None
+
+            recordings = data.get("recordings", [])
+            for recording in recordings:
+                catalogue.add(recording)
+
+            offset += len(recordings)
+            if not recordings or offset >= total:
+                return catalogue
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def _say(msg, log_only=True, is_error=False):
+        common.say(msg, log_only, is_error)
@@ -0,0 +1,152 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sqlite3
+
+from beets.library import Item
+
+from beetsplug.yearfixer import common
+
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def open_dump(path):
+    opener = _OPENERS.get(os.path.splitext(path)[1], open)
+    return opener(path, "rt", encoding="utf-8")
+
+
+def get_dump_format(path):
+    base, ext = os.path.splitext(path)
+    if ext in _OPENERS:
+        base, ext = os.path.splitext(base)
+    return "tsv" if ext == ".tsv" else "json"
+
+
+def parse_year(date):
+    try:
+        year = int(date[:4])
+    except (TypeError, ValueError):
+        return None
+    return year or None
+
+
+def read_json_dump(lines):
+    """Yields (recording_mbid, artist_mbids, title, year) from one recording JSON object per line."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            recording = json.loads(line)
+        except ValueError:
+            continue
+
+        year = common.extract_original_year_from_recording(recording)
+
+        artist_ids = [credit["artist"]["id"] for credit in recording.get("artist-credit", [])
+                      if isinstance(credit, dict) and "artist" in credit]
+        yield recording.get("id"), artist_ids, recording.get("title"), year
+
+
+def read_tsv_dump(lines):
+    """Yields (recording_mbid, artist_mbids, title, year) from lines of
+    `recording_mbid<TAB>artist_mbid[,artist_mbid...]<TAB>title<TAB>date`.
+    """
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < 4:
+            continue
+        yield fields[0], [arid for arid in fields[1].split(",") if arid], fields[2], parse_year(fields[3])
+
+
+class OfflineIndex:
+    """Lookup table of earliest release years built from a MusicBrainz data dump.
+
+    The table maps recording MBIDs and lookup keys (artist MBID and normalized title) to
+    the earliest year and is stored in an SQLite file read through a memory map.
+    """
+
+    MMAP_SIZE = 1 << 30
+
+    def __init__(self, path):
+        self.path = path
+        uri = "file:{}?mode=ro".format(os.path.abspath(path))
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._conn.execute("PRAGMA mmap_size = {}".format(self.MMAP_SIZE))
+
+    def lookup(self, item: Item):
+        mbid = item.get("mb_trackid")
+        if mbid:
+            row = self._conn.execute("SELECT year FROM recordings WHERE mbid = ?", (mbid,)).fetchone()
+            if row:
+                return row[0]
+
+        key = common.make_lookup_key(item.get("mb_artistid"), item.get("title"))
+        if key:
+            row = self._conn.execute("SELECT year FROM titles WHERE key = ?", (key,)).fetchone()
+            if row:
+                return row[0]
+
+        return None
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def build(dump_path, path, batch_size=10000):
+        """Builds the index in one streaming pass over the dump. Returns the number of recordings indexed.
+
+        Rows are upserted in batches keeping the earliest year, so memory stays bounded
+        whatever the size of the dump. The index replaces `path` only once complete.
+        """
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        conn = sqlite3.connect(tmp_path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE recordings (mbid TEXT PRIMARY KEY, year INTEGER) WITHOUT ROWID")
+        conn.execute("CREATE TABLE titles (key TEXT PRIMARY KEY, year INTEGER) WITHOUT ROWID")
+
+        upsert = "INSERT INTO {table} VALUES (?, ?) ON CONFLICT({col}) DO UPDATE SET year = MIN(year, excluded.year)"
+        recordings, titles = [], []
+        count = 0
+
+        def flush():
+            conn.executemany(upsert.format(table="recordings", col="mbid"), recordings)
+            conn.executemany(upsert.format(table="titles", col="key"), titles)
+            conn.commit()
+            recordings.clear()
+            titles.clear()
+
+        reader = read_tsv_dump if get_dump_format(dump_path) == "tsv" else read_json_dump
+        with open_dump(dump_path) as lines:
+            for mbid, artist_ids, title, year in reader(lines):
+                if not year:
+                    continue
+                count += 1
+                if mbid:
+                    recordings.append((mbid, year))
+                for artist_id in artist_ids:
+                    key = common.make_lookup_key(artist_id, title)
+                    if key:
+                        titles.append((key, year))
+                if len(recordings) + len(titles) >= batch_size:
+                    flush()
+
+        flush()
+        conn.execute("VACUUM")
+        conn.close()
+        os.replace(tmp_path, path)
+
+        return count
@@ -0,0 +1,91 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Runs `fetch(item)` in a thread pool ahead of the consumer.
+
+    `iterate` yields the items in their original order while at most `window` upcoming
+    items are being fetched. `get_key(item)` is called in the consumer thread and returns
+    the key identifying what to fetch for the item, or None when nothing needs fetching.
+    Items sharing a key are fetched once. The futures are retrieved by key with `pop`.
+    """
+
+    def __init__(self, fetch, get_key, workers, window):
+        self.fetch = fetch
+        self.get_key = get_key
+        self.window = window
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="yearfixer-fetch") if workers > 1 else None
+        self._futures = {}
+
+    def iterate(self, items):
+        if not self._executor:
+            yield from items
+            return
+
+        upcoming = deque()
+        for item in items:
+            key = self.get_key(item)
+            if key is not None and key not in self._futures:
+                self._futures[key] = self._executor.submit(self.fetch, item)
+            upcoming.append(item)
+            if len(upcoming) > self.window:
+                yield upcoming.popleft()
+
+        while upcoming:
+            yield upcoming.popleft()
+
+    def pop(self, key):
+        return self._futures.pop(key, None)
+
+    def close(self):
+        if self._executor:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures = {}
+            self._executor.shutdown(wait=True)
+
+
+class OrderedWriter:
+    """Runs `write(item)` in a thread pool and `done(item, result)` in the calling thread.
+
+    `done` is called in submission order and only after the item's write finished.
+    At most `bound` items are pending at any time.
+    """
+
+    def __init__(self, write, done, workers, bound):
+        self.write = write
+        self.done = done
+        self.bound = bound
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="yearfixer-write") if workers > 1 else None
+        self._pending = deque()
+
+    def submit(self, item):
+        if not self._executor:
+            self.done(item, self.write(item))
+            return
+
+        self._pending.append((item, self._executor.submit(self.write, item)))
+        while self._pending and (len(self._pending) > self.bound or self._pending[0][1].done()):
+            self._complete_next()
+
+    def drain(self):
+        while self._pending:
+            self._complete_next()
+
+    def close(self):
+        try:
+            self.drain()
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+
+    def _complete_next(self):
+        item, future = self._pending.popleft()
+        self.done(item, future.result())
@@ -0,0 +1,240 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import csv
+import json
+import os
+from collections import Counter
+
+from beets.library import Item, Album
+from confuse import ConfigValueError
+
+from beetsplug.yearfixer import common
+from beetsplug.yearfixer.means import MeanIndex, is_valid_year, get_mean_year
+from beetsplug.yearfixer.stats import RunStats
+
+PROVIDER_NAMES = ("year_map", "cache", "musicbrainz", "album_mean", "artist_mean")
+
+
+class YearProvider:
+    """A source of year values, asked for one field of one item (or of one album) at a time.
+
+    Local providers answer without network requests. Fallback providers (the means) only
+    fill in missing values: they are not asked when the field of an item already has a value.
+    """
+
+    name = None
+    local = True
+    fallback = False
+
+    def lookup(self, item: Item, field):
+        """Returns the value of the field for the item, None if the provider does not know it."""
+        raise NotImplementedError
+
+    def peek(self, item: Item, field):
+        """Like `lookup` but without side effects, e.g. to decide whether a lookup is worth prefetching."""
+        return self.lookup(item, field)
+
+    def lookup_album(self, album: Album, items, field):
+        """Returns the value of the field for all the tracks (`items`) of the album, None if it is not known."""
+        return None
+
+    def close(self):
+        pass
+
+
+class CacheProvider(YearProvider):
+    """The `original_year` found by earlier lookups of the same recording (or release group), in this run or
+    cached."""
+
+    name = "cache"
+
+    def __init__(self, get_known_year, get_known_album_year=None):
+        self.get_known_year = get_known_year
+        self.get_known_album_year = get_known_album_year
+
+    def lookup(self, item: Item, field):
+        if field != "original_year":
+            return None
+        # recordings known to have no year are left to the musicbrainz provider, which skips them
+        return self.get_known_year(item, negative=False)[1]
+
+    def peek(self, item: Item, field):
+        # the prefetcher checks the cache itself
+        return None
+
+    def lookup_album(self, album: Album, items, field):
+        if field != "original_year" or not self.get_known_album_year:
+            return None
+        return self.get_known_album_year(album, negative=False)[1]
+
+
+class MusicBrainzProvider(YearProvider):
+    """The `original_year` of the recording (or of the release group of an album) looked up on MusicBrainz."""
+
+    name = "musicbrainz"
+    local = False
+
+    def __init__(self, get_mb_year, get_album_year=None):
+        self.get_mb_year = get_mb_year
+        self.get_album_year = get_album_year
+
+    def lookup(self, item: Item, field):
+        return self.get_mb_year(item) if field == "original_year" else None
+
+    def peek(self, item: Item, field):
+        return None
+
+    def lookup_album(self, album: Album, items, field):
+        return self.get_album_year(album) if field == "original_year" and self.get_album_year else None
+
+
+class MeanProvider(YearProvider):
+    """The mean value of the field on the album or on the artist of the item.
+
+    Means calculated from fewer than `min_items` items are not taken into account.
+    """
+
+    fallback = True
+
+    def __init__(self, name, mean_index: MeanIndex, group_field, min_items=1):
+        self.name = name
+        self.mean_index = mean_index
+        self.group_field = group_field
+        self.min_items = min_items
+
+    def lookup(self, item: Item, field):
+        return self._get_mean(item.get(self.group_field), field)
+
+    def lookup_album(self, album: Album, items, field):
+        # the group of most of the tracks, e.g. the main artist of a compilation
+        groups = Counter(item.get(self.group_field) for item in items if item.get(self.group_field))
+        return self._get_mean(groups.most_common(1)[0][0], field) if groups else None
+
+    def _get_mean(self, group_value, field):
+        if self.mean_index.count(self.group_field, group_value, field) < self.min_items:
+            return None
+
+        return self.mean_index.mean(self.group_field, group_value, field)
+
+
+class AlbumMeanProvider(MeanProvider):
+    """The mean value of the field on the album of the item; for a whole album, the mean on its tracks."""
+
+    def __init__(self, mean_index: MeanIndex, min_items=1):
+        super().__init__("album_mean", mean_index, "mb_albumid", min_items)
+
+    def lookup_album(self, album: Album, items, field):
+        years = [item.get(field) for item in items if is_valid_year(item.get(field))]
+        return get_mean_year(years) if len(years) >= self.min_items else None
+
+
+class YearMapProvider(YearProvider):
+    """Years listed in a local CSV or JSON file.
+
+    Each row (a CSV line with a header, or an object of a JSON list) gives the `year`
+    and/or the `original_year` of a recording (`mb_trackid`), of an album (`mb_albumid`)
+    or of a title of an artist (`mb_artistid` and `title`). The recording rows are
+    looked at first, then the album rows and then the title rows.
+    """
+
+    name = "year_map"
+
+    def __init__(self, path):
+        self.by_trackid = {}
+        self.by_albumid = {}
+        self.by_title = {}
+        for row in self._read_rows(path):
+            values = {field: int(row[field]) for field in common.YEAR_FIELDS if row.get(field)}
+            if row.get("mb_trackid"):
+                self.by_trackid[row["mb_trackid"]] = values
+            elif row.get("mb_albumid"):
+                self.by_albumid[row["mb_albumid"]] = values
+            elif row.get("mb_artistid") and row.get("title"):
+                self.by_title[common.make_lookup_key(row["mb_artistid"], row["title"])] = values
+
+    @staticmethod
+    def _read_rows(path):
+        with open(path, encoding="utf-8", newline="") as map_file:
+            if os.path.splitext(path)[1].lower() == ".json":
+                return json.load(map_file)
+            return list(csv.DictReader(map_file))
+
+    def lookup_album(self, album: Album, items, field):
+        values = self.by_albumid.get(album.get("mb_albumid"))
+        return values[field] if values and is_valid_year(values.get(field)) else None
+
+    def lookup(self, item: Item, field):
+        for values in (self.by_trackid.get(item.get("mb_trackid")),
+                       self.by_albumid.get(item.get("mb_albumid")),
+                       self.by_title.get(common.get_lookup_key(item))):
+            if values and is_valid_year(values.get(field)):
+                return values[field]
+
+        return None
+
+
+class ProviderChain:
+    """The providers of each field, asked in turn: the first one answering gives the value.
+
+    Each provider is timed as the `provider_<name>` stage and its hits and misses are
+    counted as `provider_<name>_hits` and `provider_<name>_misses`.
+    """
+
+    def __init__(self, providers, stats: RunStats):
+        # field -> [YearProvider]
+        self.providers = providers
+        self.stats = stats
+
+    def resolve(self, item: Item, field, current=None):
+        """Returns (value, provider name), (None, None) if no provider answers."""
+        return self._resolve(self._get_providers(field, current), lambda provider: provider.lookup(item, field))
+
+    def resolve_album(self, album: Album, items, field):
+        """Returns (value, provider name) for all the tracks of the album, (None, None) if no provider answers.
+
+        The means are always asked: they give the tracks of an album the same value.
+        """
+        return self._resolve(self.providers.get(field, ()), lambda provider: provider.lookup_album(album, items, field))
+
+    def _resolve(self, providers, lookup):
+        for provider in providers:
+            with self.stats.timer("provider_{}".format(provider.name)):
+                value = lookup(provider)
+            self.stats.count("provider_{}_{}".format(provider.name, "hits" if value else "misses"))
+            if value:
+                return value, provider.name
+
+        return None, None
+
+    def is_settled_before(self, item: Item, field, name, current=None):
+        """Whether the field is settled for the item before the provider `name` would be asked."""
+        for provider in self._get_providers(field, current):
+            if provider.name == name:
+                return False
+            if provider.local and provider.peek(item, field):
+                return True
+
+        # not in the chain
+        return True
+
+    def close(self):
+        for provider in {provider for providers in self.providers.values() for provider in providers}:
+            provider.close()
+
+    def _get_providers(self, field, current):
+        return (provider for provider in self.providers.get(field, ()) if not (provider.fallback and current))
+
+
+def get_provider_names(cfg, field):
+    """Returns the names of the providers configured for the field, in order."""
+    names = cfg[field].as_str_seq()
+    for name in names:
+        if name not in PROVIDER_NAMES:
+            raise ConfigValueError("providers.{}: unknown provider `{}`, expected one of: {}".format(
+                field, name, ", ".join(PROVIDER_NAMES)))
+
+    return names
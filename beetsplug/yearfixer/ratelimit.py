@@ -0,0 +1,93 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """Paces outgoing requests to `rate` requests per second allowing bursts of `burst`.
+
+    `pause` stops handing out tokens for a while, which is how the limits advertised by
+    the server (Retry-After, X-RateLimit-*) are honoured.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                elif self._tokens >= 1 or self.rate <= 0:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+
+def get_server_delay(headers, now=None):
+    """Returns the number of seconds the server asked us to wait or None.
+
+    Honours `Retry-After` (seconds or HTTP date) and, when no requests are remaining,
+    the `X-RateLimit-Reset` epoch timestamp.
+    """
+    now = time.time() if now is None else now
+
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - now)
+        except (TypeError, ValueError):
+            pass
+
+    remaining = headers.get("X-RateLimit-Remaining")
+    reset = headers.get("X-RateLimit-Reset")
+    if remaining is not None and reset:
+        try:
+            if int(remaining) <= 0:
+                return max(0.0, float(reset) - now)
+        except ValueError:
+            pass
+
+    return None
+
+
+def get_backoff_delay(attempt, base, cap, rand=random.random):
+    """Exponential backoff with full jitter for the n-th (1 based) attempt."""
+    return rand() * min(cap, base * 2 ** (attempt - 1))
@@ -0,0 +1,94 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.dbcore.query import Query, Sort, NullSort, MatchQuery, OrQuery
+from beets.library import Library, Item
+
+from beetsplug.yearfixer import common
+
+RECORD_FIELDS = ("id", "mb_albumid", "mb_artistid", "year", "original_year", "title", "mb_trackid", "mtime")
+MARKER_ATTRS = (common.CHECKED_ATTR, common.OUTCOME_ATTR, common.MTIME_ATTR)
+# the values are read from SQL like beets does: NULL and '' years become 0...
+RECORD_TYPES = tuple(Item._type(field) for field in RECORD_FIELDS)
+
+
+class ItemRecord:
+    """The columns of an item needed to fix it, read like the fields of an `Item`.
+
+    Selected items are loaded as records: the full `Item` (with all of its fields and
+    flexible attributes) is only loaded for the items that get modified. The only
+    flexible attributes loaded are the markers of the previous runs, when asked for.
+    """
+
+    __slots__ = RECORD_FIELDS + ("markers",)
+
+    def __init__(self, values, markers=None):
+        for field, value in zip(RECORD_FIELDS, values):
+            setattr(self, field, value)
+        self.markers = markers
+
+    @classmethod
+    def from_item(cls, item: Item, with_markers=False):
+        markers = {attr: item[attr] for attr in MARKER_ATTRS if attr in item} if with_markers else None
+        return cls([item.get(field) for field in RECORD_FIELDS], markers)
+
+    def get(self, key, default=None):
+        if key in RECORD_FIELDS:
+            return getattr(self, key)
+        return self.markers.get(key, default) if self.markers else default
+
+    def __contains__(self, key):
+        return key in RECORD_FIELDS or bool(self.markers and key in self.markers)
+
+    def __str__(self):
+        return "{} (id: {})".format(self.title, self.id)
+
+
+def load_item_records(lib: Library, query: Query, sort: Sort = None, with_markers=False):
+    """Returns the records of the items matching the query, in the order of `sort` (or the default one).
+
+    Queries and sorts that cannot be run in SQL (e.g. on flexible attributes) are run by
+    beets, the records are then made from the items.
+    """
+    sort = sort if sort and not isinstance(sort, NullSort) else lib.get_default_item_sort()
+    where, subvals = query.clause()
+    order_by = sort.order_clause()
+    if where is None or sort.is_slow():
+        return [ItemRecord.from_item(item, with_markers) for item in lib.items(query, sort)]
+
+    columns = ", ".join(RECORD_FIELDS)
+    if with_markers:
+        columns += "".join(", (SELECT value FROM item_attributes WHERE entity_id = items.id AND key = ?)"
+                           for _ in MARKER_ATTRS)
+        subvals = MARKER_ATTRS + tuple(subvals)
+    sql = "SELECT {} FROM items WHERE {} {}".format(columns, where, "ORDER BY {}".format(order_by) if order_by else "")
+
+    with lib.transaction() as tx:
+        rows = tx.query(sql, subvals)
+
+    fields = len(RECORD_FIELDS)
+    if not with_markers:
+        return [ItemRecord(_get_values(row)) for row in rows]
+
+    return [ItemRecord(_get_values(row), {attr: value for attr, value in zip(MARKER_ATTRS, tuple(row)[fields:])
+                                          if value is not None}) for row in rows]
+
+
+def load_item_records_by_id(lib: Library, item_ids, with_markers=False, chunk_size=500):
+    """Returns the records of the items with the given ids, in the same order. Removed items are left out.
+
+    The items are read by chunks of ids, each with a single query.
+    """
+    records = {}
+    for start in range(0, len(item_ids), chunk_size):
+        query = OrQuery([MatchQuery("id", item_id) for item_id in item_ids[start:start + chunk_size]])
+        records.update((record.id, record) for record in load_item_records(lib, query, with_markers=with_markers))
+
+    return [records[item_id] for item_id in item_ids if item_id in records]
+
+
+def _get_values(row):
+    return [field_type.from_sql(value) for field_type, value in zip(RECORD_TYPES, row)]
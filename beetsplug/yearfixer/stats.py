@@ -0,0 +1,143 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    """Durations counted in buckets whose upper bounds double from 1ms up to about 16s."""
+
+    BOUNDS = tuple(0.001 * 2 ** i for i in range(15))
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = 0
+        while index < len(self.BOUNDS) and seconds > self.BOUNDS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket holding the given percentile (the max for the last one)."""
+        if not self.count:
+            return 0.0
+
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+            "buckets": {("<={:g}".format(bound) if i < len(self.BOUNDS) else ">{:g}".format(self.BOUNDS[-1])): n
+                        for i, (bound, n) in enumerate(zip(self.BOUNDS + (None,), self.buckets)) if n},
+        }
+
+
+class RunStats:
+    """Counters and per-stage latency histograms of a run.
+
+    The counters are shared with the rest of the command (cache hits, retries...). Stages
+    can be timed and counters incremented (with `count`) from any thread.
+    """
+
+    def __init__(self, counters: Counter = None):
+        self.counters = counters if counters is not None else Counter()
+        self.stages = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started)
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = LatencyHistogram()
+            self.stages[stage].add(seconds)
+
+    def count(self, name, n=1):
+        """Increments a counter, safely from any thread."""
+        with self._lock:
+            self.counters[name] += n
+
+    def merge(self, counters: Counter, stages):
+        """Adds the counters and the timings of another run, e.g. of a worker process."""
+        with self._lock:
+            self.counters.update(counters)
+            for stage, histogram in stages.items():
+                self.stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+
+    def get_hit_rates(self):
+        """Returns the share of hits of each `<name>_hits` / `<name>_misses` pair of counters (cache, providers)."""
+        rates = {}
+        for counter, hits in sorted(self.counters.items()):
+            if counter.endswith("_hits"):
+                name = counter[:-len("_hits")]
+                total = hits + self.counters["{}_misses".format(name)]
+                rates[name] = hits / total if total else 0.0
+
+        return rates
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "elapsed": time.monotonic() - self.started,
+                "counters": dict(sorted(self.counters.items())),
+                "hit_rates": self.get_hit_rates(),
+                "stages": {stage: histogram.to_dict() for stage, histogram in sorted(self.stages.items())},
+            }
+
+    def get_summary_lines(self):
+        report = self.to_dict()
+        lines = ["Run time: {:.2f}s".format(report["elapsed"])]
+        lines += ["{}: {}".format(name, count) for name, count in report["counters"].items()]
+        lines += ["{} hit rate: {:.1%}".format(name, rate) for name, rate in report["hit_rates"].items()]
+        for stage, times in report["stages"].items():
+            lines.append("{}: {} calls, total {:.3f}s, mean {:.1f}ms, p50 <={:.1f}ms, p95 <={:.1f}ms, max {:.1f}ms"
+                         .format(stage, times["count"], times["total"], times["mean"] * 1000,
+                                 times["p50"] * 1000, times["p95"] * 1000, times["max"] * 1000))
+        return lines
+
+    def write_report(self, path, **extra):
+        report = self.to_dict()
+        report.update(extra)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
@@ -0,0 +1,57 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.library import Item
+
+from beetsplug.yearfixer.means import MeanIndex
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+class MeanIndexTest(TestHelper, Assertions):
+    """Test the album/artist mean index.
+    """
+
+    def _add_item(self, **values):
+        item = Item(title=u'track', **values)
+        self.lib.add(item)
+        return item
+
+    def test_mean_matches_library_values(self):
+        self._add_item(mb_albumid='alb-1', mb_artistid='art-1', year=2000, original_year=1990)
+        self._add_item(mb_albumid='alb-1', mb_artistid='art-1', year=2003, original_year=0)
+        self._add_item(mb_albumid='alb-2', mb_artistid='art-1', year=2100, original_year=1971)
+
+        index = MeanIndex()
+        index.build(self.lib)
+
+        self.assertEqual(2002, index.mean('mb_albumid', 'alb-1', 'year'))
+        self.assertEqual(1990, index.mean('mb_albumid', 'alb-1', 'original_year'))
+        self.assertIsNone(index.mean('mb_albumid', 'alb-2', 'year'))
+        self.assertEqual(2002, index.mean('mb_artistid', 'art-1', 'year'))
+        self.assertEqual(1980, index.mean('mb_artistid', 'art-1', 'original_year'))
+        self.assertIsNone(index.mean('mb_artistid', 'art-2', 'year'))
+
+    def test_update_replaces_old_value(self):
+        item = self._add_item(mb_albumid='alb-1', mb_artistid='art-1', year=0)
+        self._add_item(mb_albumid='alb-1', mb_artistid='art-1', year=2000)
+
+        index = MeanIndex()
+        index.build(self.lib)
+        index.update(item, 'year', 0, 2010)
+        self.assertEqual(2005, index.mean('mb_albumid', 'alb-1', 'year'))
+
+        index.update(item, 'year', 2010, 2020)
+        self.assertEqual(2010, index.mean('mb_artistid', 'art-1', 'year'))
+
+    def test_command_uses_sequentially_updated_means(self):
+        self._add_item(mb_albumid='alb-1', year=1999, original_year=1999)
+        first = self._add_item(mb_albumid='alb-1', year=0, original_year=0)
+        second = self._add_item(mb_albumid='alb-1', year=0, original_year=0)
+
+        self.runcli(PLUGIN_NAME)
+
+        self.assertEqual(1999, self.lib.get_item(first.id).year)
+        self.assertEqual(1999, self.lib.get_item(second.id).original_year)
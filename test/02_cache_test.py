@@ -0,0 +1,66 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+
+from beetsplug.yearfixer.cache import LookupCache
+from test.helper import TestHelper, Assertions
+
+
+class LookupCacheTest(TestHelper, Assertions):
+    """Test the persistent MusicBrainz lookup cache.
+    """
+
+    def _get_cache(self, ttl=100, negative_ttl=100, max_entries=100):
+        path = os.path.join(self.mkdtemp(), "cache.db")
+        return LookupCache(path, ttl=ttl, negative_ttl=negative_ttl, max_entries=max_entries)
+
+    def test_positive_and_negative_entries(self):
+        cache = self._get_cache()
+        cache.set("a", 1977)
+        cache.set("b", None)
+
+        self.assertEqual((True, 1977), cache.get("a"))
+        self.assertEqual((True, None), cache.get("b"))
+        self.assertEqual((False, None), cache.get("c"))
+        cache.close()
+
+    def test_expired_entries_are_misses(self):
+        cache = self._get_cache(ttl=100, negative_ttl=-1)
+        cache.set("a", 1977)
+        cache.set("b", None)
+
+        self.assertEqual((True, 1977), cache.get("a"))
+        self.assertEqual((False, None), cache.get("b"))
+        cache.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self._get_cache(max_entries=2)
+        cache.set("a", 1970)
+        cache.set("b", 1971)
+        cache.set("c", 1972)
+        cache.get("a")
+        cache.close()
+
+        cache = LookupCache(cache.path, ttl=100, negative_ttl=100, max_entries=2)
+        self.assertEqual((True, 1970), cache.get("a"))
+        self.assertEqual((False, None), cache.get("b"))
+        self.assertEqual((True, 1972), cache.get("c"))
+        cache.close()
+
+    def test_reads_do_not_lock_the_cache(self):
+        cache = self._get_cache(ttl=100, negative_ttl=-1)
+        cache.set("a", 1977)
+        cache.set("b", None)
+        # a hit updates the access time, an expired entry is deleted
+        cache.get("a")
+        cache.get("b")
+
+        other = LookupCache(cache.path, ttl=100, negative_ttl=100, max_entries=100, timeout=0.1)
+        other.set("c", 1980)
+        self.assertEqual((True, 1980), cache.get("c"))
+        other.close()
+        cache.close()
@@ -0,0 +1,86 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.library import Item
+
+from beetsplug.yearfixer.ratelimit import TokenBucket, get_server_delay, get_backoff_delay
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class RateLimitTest(TestHelper, Assertions):
+    """Test the request scheduler.
+    """
+
+    def test_token_bucket_paces_requests(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=1, clock=clock, sleep=clock.sleep)
+
+        self.assertEqual(0, bucket.acquire())
+        self.assertAlmostEqual(0.5, bucket.acquire())
+        self.assertAlmostEqual(0.5, bucket.acquire())
+        self.assertAlmostEqual(1.0, clock.now)
+
+    def test_token_bucket_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, burst=5, clock=clock, sleep=clock.sleep)
+
+        bucket.pause(3)
+        bucket.acquire()
+        self.assertGreaterEqual(clock.now, 3)
+
+    def test_server_delay_headers(self):
+        self.assertEqual(7, get_server_delay({"Retry-After": "7"}))
+        self.assertEqual(30, get_server_delay({"Retry-After": "Thu, 01 Jan 1970 00:00:30 GMT"}, now=0))
+        self.assertEqual(5, get_server_delay({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "105"}, now=100))
+        self.assertIsNone(get_server_delay({"X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "105"}, now=100))
+        self.assertIsNone(get_server_delay({}))
+
+    def test_backoff_delay_is_capped(self):
+        self.assertEqual(4, get_backoff_delay(3, base=1, cap=60, rand=lambda: 1.0))
+        self.assertEqual(60, get_backoff_delay(10, base=1, cap=60, rand=lambda: 1.0))
+
+    def _run_against_stub(self, resolver=None, **stub_options):
+        self.config[PLUGIN_NAME]["musicbrainz"]["max_retries"] = 3
+        self.config[PLUGIN_NAME]["musicbrainz"]["backoff_base"] = 0.01
+        return self.run_with_stub(resolver, **stub_options)
+
+    def test_retries_after_server_limit(self):
+        item = Item(title=u'song', mb_artistid=u'art-1', year=0, original_year=0)
+        self.lib.add(item)
+
+        resolver = lambda path, params: (200, {"recordings": [{"releases": [{"date": "1969-06-01"}]}]})
+        stub = self._run_against_stub(resolver, failures=2, retry_after=0)
+
+        self.assertEqual(3, stub.request_count)
+        self.assertEqual(1969, self.lib.get_item(item.id).original_year)
+
+    def test_failed_items_are_requeued(self):
+        item = Item(title=u'song', mb_artistid=u'art-1', year=0, original_year=0)
+        self.lib.add(item)
+
+        stub = self._run_against_stub(failures=100, retry_after=0)
+
+        self.assertEqual(6, stub.request_count)
+
+    def test_hung_requests_time_out(self):
+        item = Item(title=u'song', mb_artistid=u'art-1', year=0, original_year=0)
+        self.lib.add(item)
+
+        self.config[PLUGIN_NAME]["musicbrainz"]["read_timeout"] = 0.05
+        stub = self._run_against_stub(latency=0.2)
+
+        self.assertEqual(6, stub.request_count)
@@ -0,0 +1,93 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from unittest import mock
+
+from beets.library import Item
+
+from beetsplug.yearfixer.common import PENDING_WRITE_ATTR
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+def year_by_title_resolver(path, params):
+    # titles look like "song-1977"
+    title = params.get("query", "").rsplit('"', 2)[-2]
+    year = title.rsplit("-", 1)[-1]
+    if not year.isdigit():
+        return 200, {"recordings": []}
+    return 200, {"recordings": [{"releases": [{"date": "{}-01-01".format(year)}]}]}
+
+
+class PipelineTest(TestHelper, Assertions):
+    """Test the concurrent lookup/write pipeline.
+    """
+
+    def _run(self, *args):
+        items = []
+        for i in range(12):
+            title = u'song-{}'.format(1960 + i) if i % 3 else u'song-x'
+            item = Item(title=title, mb_artistid=u'art-1', mb_albumid=u'alb-{}'.format(i % 2),
+                        year=0, original_year=0)
+            self.lib.add(item)
+            items.append(item)
+
+        self.run_with_stub(year_by_title_resolver, *args, latency=0.01)
+
+        results = []
+        for item in items:
+            stored = self.lib.get_item(item.id)
+            results.append((stored.year, stored.original_year))
+            stored.remove()
+        return results
+
+    def test_workers_give_same_results(self):
+        sequential = self._run()
+        concurrent = self._run("--workers", "4")
+
+        self.assertEqual(sequential, concurrent)
+        self.assertIn((1961, 1961), concurrent)
+
+    def test_pages_give_same_results(self):
+        unpaged = self._run()
+        paged = self._run("--page-size", "5", "--workers", "2")
+
+        self.assertEqual(unpaged, paged)
+
+    def test_duplicate_recordings_are_looked_up_once(self):
+        for title in [u'Song', u'song', u'  SONG ', u'Other']:
+            for _ in range(3):
+                self.lib.add(Item(title=title, mb_artistid=u'art-1', year=0, original_year=0))
+
+        for workers in ("1", "3"):
+            stub = self.run_with_stub(None, "--workers", workers)
+            self.assertEqual(2, stub.request_count)
+
+    def test_unchanged_items_are_not_written(self):
+        unresolvable = Item(title=u'song', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0)
+        resolvable = Item(title=u'song', mb_albumid=u'alb-2', mb_artistid=u'art-2', year=0, original_year=1980)
+        self.lib.add(unresolvable)
+        self.lib.add(resolvable)
+
+        with mock.patch.object(Item, "try_write") as try_write, mock.patch.object(Item, "store") as store:
+            self.run_with_stub()
+
+        self.assertEqual(1, try_write.call_count)
+        self.assertEqual(1, store.call_count)
+
+    def test_no_write_then_flush_writes(self):
+        item = Item(title=u'song', mb_albumid=u'alb-1', year=0, original_year=1980)
+        self.lib.add(item)
+
+        with mock.patch.object(Item, "try_write", return_value=True) as try_write:
+            self.runcli(PLUGIN_NAME, "--no-write")
+            self.assertEqual(0, try_write.call_count)
+            stored = self.lib.get_item(item.id)
+            self.assertEqual(1980, stored.year)
+            self.assertIn(PENDING_WRITE_ATTR, stored)
+
+            self.runcli(PLUGIN_NAME, "--flush-writes")
+            self.assertEqual(1, try_write.call_count)
+            self.assertNotIn(PENDING_WRITE_ATTR, self.lib.get_item(item.id))
@@ -0,0 +1,82 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+from unittest import mock
+
+from beets.library import Item
+
+from beetsplug.yearfixer.checkpoint import CheckpointJournal
+from beetsplug.yearfixer.command import YearFixerCommand
+from test.helper import TestHelper, Assertions, PLUGIN_NAME, capture_log
+
+
+class CheckpointTest(TestHelper, Assertions):
+    """Test resumable runs.
+    """
+
+    def test_journal_resume_and_stale_signature(self):
+        path = os.path.join(self.mkdtemp(), "journal.jsonl")
+
+        journal = CheckpointJournal(path, "sig-1")
+        journal.open()
+        journal.record(1, changed=True)
+        journal.record(2, changed=False)
+        journal.flush()
+        journal.record(3, changed=False)
+        journal.close()
+
+        journal = CheckpointJournal(path, "sig-1")
+        self.assertEqual(3, journal.open(resume=True))
+        self.assertTrue(journal.is_done(2))
+        journal.close(completed=True)
+        self.assertFalse(os.path.exists(path))
+
+        journal = CheckpointJournal(path, "sig-1")
+        journal.open()
+        journal.close()
+        journal = CheckpointJournal(path, "sig-2")
+        self.assertEqual(0, journal.open(resume=True))
+        self.assertTrue(journal.stale)
+        journal.close()
+
+    def test_interrupted_run_is_resumed(self):
+        for i in range(4):
+            self.lib.add(Item(title=u'song', mb_albumid=u'alb-1', year=0, original_year=1990 + i))
+        self.config[PLUGIN_NAME]["batch_size"] = 1
+
+        original = YearFixerCommand.process_item
+        calls = []
+
+        def interrupting(command, item):
+            calls.append(item.id)
+            if len(calls) == 3:
+                raise KeyboardInterrupt()
+            original(command, item)
+
+        with mock.patch.object(YearFixerCommand, "process_item", interrupting):
+            with self.assertRaises(KeyboardInterrupt):
+                self.runcli(PLUGIN_NAME, "--force")
+            self.assertEqual(2, len([it for it in self.lib.items() if it.year]))
+
+            calls.clear()
+            self.runcli(PLUGIN_NAME, "--force", "--resume")
+
+        self.assertEqual(2, len(calls))
+        self.assertEqual(4, len([it for it in self.lib.items() if it.year]))
+
+    def test_other_mode_starts_over(self):
+        self.lib.add(Item(title=u'song', mb_albumid=u'alb-1', year=0, original_year=1990))
+        self.lib.add(Item(title=u'song', mb_albumid=u'alb-1', year=0, original_year=1991))
+
+        with mock.patch.object(YearFixerCommand, "process_item", side_effect=KeyboardInterrupt()):
+            with self.assertRaises(KeyboardInterrupt):
+                self.runcli(PLUGIN_NAME, "--force")
+
+        with capture_log('beets.yearfixer') as logs:
+            self.runcli(PLUGIN_NAME, "--force", "--resume", "--since-last-run")
+
+        self.assertTrue(any("Starting over" in line for line in logs))
@@ -0,0 +1,73 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+
+from beets.library import Item
+
+from beetsplug.yearfixer.offline import OfflineIndex
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+class OfflineIndexTest(TestHelper, Assertions):
+    """Test the offline index built from a MusicBrainz dump.
+    """
+
+    def _dump_path(self):
+        return os.path.join(self._test_fixture_dir, b'mb_dump.jsonl').decode()
+
+    def test_build_keeps_earliest_year(self):
+        path = os.path.join(self.mkdtemp(), "offline.db")
+        self.assertEqual(3, OfflineIndex.build(self._dump_path(), path))
+
+        index = OfflineIndex(path)
+        self.assertEqual(1979, index.lookup(Item(mb_trackid=u'rec-1')))
+        self.assertEqual(1975, index.lookup(Item(mb_artistid=u'art-1', title=u'first  SONG')))
+        self.assertEqual(1991, index.lookup(Item(mb_artistid=u'art-2', title=u'Second Song')))
+        self.assertIsNone(index.lookup(Item(mb_artistid=u'art-1', title=u'Undated Song')))
+        index.close()
+
+    def test_build_from_tsv(self):
+        tmpdir = self.mkdtemp()
+        dump_path = os.path.join(tmpdir, "dump.tsv")
+        with open(dump_path, "w") as dump:
+            dump.write("rec-1\tart-1,art-2\tSong\t2001-01-01\n")
+            dump.write("rec-2\tart-1\tsong\t1999\n")
+        path = os.path.join(tmpdir, "offline.db")
+        OfflineIndex.build(dump_path, path)
+
+        index = OfflineIndex(path)
+        self.assertEqual(1999, index.lookup(Item(mb_artistid=u'art-1', title=u'Song')))
+        self.assertEqual(2001, index.lookup(Item(mb_artistid=u'art-2', title=u'Song')))
+        index.close()
+
+    def test_offline_run_makes_no_network_calls(self):
+        self.runcli("{}-index".format(PLUGIN_NAME), self._dump_path())
+
+        by_mbid = Item(title=u'x', mb_trackid=u'rec-2', mb_artistid=u'art-9', year=0, original_year=0)
+        by_title = Item(title=u'First Song', mb_artistid=u'art-1', year=0, original_year=0)
+        self.lib.add(by_mbid)
+        self.lib.add(by_title)
+
+        stub = self.run_with_stub(None, "--offline")
+
+        self.assertEqual(0, stub.request_count)
+        self.assertEqual(1991, self.lib.get_item(by_mbid.id).original_year)
+        self.assertEqual(1975, self.lib.get_item(by_title.id).original_year)
+
+    def test_offline_per_album_run_makes_no_network_calls(self):
+        self.runcli("{}-index".format(PLUGIN_NAME), self._dump_path())
+
+        album = self.lib.add_album([Item(title=u'a', mb_albumid=u'alb-1', year=1980, original_year=0)])
+        album.mb_releasegroupid = u'rg-1'
+        album.store()
+        single = self.lib.add(Item(title=u'First Song', mb_artistid=u'art-1', year=0, original_year=0))
+
+        stub = self.run_with_stub(None, "--offline", "--per-album")
+
+        self.assertEqual(0, stub.request_count)
+        self.assertEqual(1980, album.items().get().original_year)
+        self.assertEqual(1975, self.lib.get_item(single).original_year)
@@ -0,0 +1,54 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.library import Item
+
+from beetsplug.yearfixer import common
+from beetsplug.yearfixer.common import LOOKUP_PATH_ATTR
+from test.helper import TestHelper, Assertions
+
+
+def recording_resolver(path, params):
+    if path == "/ws/2/recording/rec-1":
+        return 200, {"id": "rec-1", "releases": [{"date": "1972-03-01"}, {"date": "1970"}]}
+    if path.startswith("/ws/2/recording/") and path != "/ws/2/recording/":
+        return 404, {"error": "Not Found"}
+    return 200, {"recordings": [{"releases": [{"date": "1988"}]}]}
+
+
+class LookupPathTest(TestHelper, Assertions):
+    """Test the direct recording lookups and the search fallback.
+    """
+
+    def test_lookup_paths(self):
+        by_mbid = Item(title=u'a', mb_trackid=u'rec-1', mb_artistid=u'art-1', year=0, original_year=0)
+        stale_mbid = Item(title=u'b', mb_trackid=u'rec-gone', mb_artistid=u'art-1', year=0, original_year=0)
+        no_mbid = Item(title=u'c', mb_artistid=u'art-1', year=0, original_year=0)
+        for item in (by_mbid, stale_mbid, no_mbid):
+            self.lib.add(item)
+
+        stub = self.run_with_stub(recording_resolver)
+
+        self.assertEqual(4, stub.request_count)
+        self.assertIn("/ws/2/recording/rec-1?inc=releases&fmt=json", [path for _, path in stub.requests])
+
+        expected = [(by_mbid, 1970, "mbid"), (stale_mbid, 1988, "mbid+search"), (no_mbid, 1988, "search")]
+        for item, year, path in expected:
+            stored = self.lib.get_item(item.id)
+            self.assertEqual(year, stored.original_year)
+            self.assertEqual(path, stored.get(LOOKUP_PATH_ATTR))
+
+    def test_search_limit_and_min_score(self):
+        item = Item(title=u'a b', mb_artistid=u'art-1')
+        self.assertTrue(common.get_mb_search_url(item, limit=5).endswith("&fmt=json&limit=5"))
+
+        data = {"recordings": [
+            {"score": 100, "first-release-date": "1975", "releases": [{"date": "1960"}]},
+            {"score": "90", "releases": [{"date": "1972"}, {"date": "1981"}]},
+            {"score": 40, "releases": [{"date": "1950"}]},
+        ]}
+        self.assertEqual(1972, common.extract_original_year_from_mb_data(data, min_score=80))
+        self.assertEqual(1950, common.extract_original_year_from_mb_data(data))
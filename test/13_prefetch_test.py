@@ -0,0 +1,71 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from unittest import mock
+
+from beets.library import Item, Library
+
+from beetsplug.yearfixer.common import LOOKUP_PATH_ATTR
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+def browse_resolver(path, params):
+    if path == "/ws/2/recording" and params.get("artist") == "art-1":
+        offset = int(params["offset"])
+        recordings = [{"id": "rec-{}".format(i), "title": "Song {}".format(i),
+                       "first-release-date": "{}-01-01".format(1960 + i)}
+                      for i in range(offset, min(offset + 100, 150))]
+        return 200, {"recording-count": 150, "recording-offset": offset, "recordings": recordings}
+    return 200, {"recordings": [{"releases": [{"date": "1999"}]}]}
+
+
+class ArtistPrefetchTest(TestHelper, Assertions):
+    """Test the artist level prefetch with browse requests.
+    """
+
+    def test_prefetch_artist_recordings(self):
+        for i in range(6):
+            self.lib.add(Item(title=u'song {}'.format(i), mb_artistid=u'art-1', year=0, original_year=0))
+        self.lib.add(Item(title=u'Song 120', mb_trackid=u'rec-120', mb_artistid=u'art-1', year=0, original_year=0))
+        self.lib.add(Item(title=u'missing', mb_artistid=u'art-1', year=0, original_year=0))
+        self.lib.add(Item(title=u'other', mb_artistid=u'art-2', year=0, original_year=0))
+
+        stub = self.run_with_stub(browse_resolver, "--prefetch-artists")
+
+        # two browse pages, one search for the missing title and one for the other artist
+        self.assertEqual(4, stub.request_count)
+
+        items = {item.title: item for item in self.lib.items()}
+        self.assertEqual(1963, items["song 3"].original_year)
+        self.assertEqual("artist", items["song 3"].get(LOOKUP_PATH_ATTR))
+        self.assertEqual(2080, items["Song 120"].original_year)
+        self.assertEqual(1999, items["missing"].original_year)
+        self.assertEqual("search", items["missing"].get(LOOKUP_PATH_ATTR))
+
+    def test_artist_over_the_page_limit(self):
+        for i in range(6):
+            self.lib.add(Item(title=u'song {}'.format(i), mb_artistid=u'art-1', year=0, original_year=0))
+        self.config[PLUGIN_NAME]["prefetch"]["max_pages"] = 1
+
+        stub = self.run_with_stub(browse_resolver, "--prefetch-artists")
+
+        # the first browse page tells the artist has too many recordings, the items are searched
+        self.assertEqual(1 + 6, stub.request_count)
+        self.assertEqual({"search"}, {item.get(LOOKUP_PATH_ATTR) for item in self.lib.items()})
+
+    def test_selection_is_counted_on_the_records(self):
+        for i in range(6):
+            item = Item(title=u'song {}'.format(i), mb_artistid=u'art-1', year=0, original_year=0)
+            item["source"] = u'cd'
+            self.lib.add(item)
+
+        # a flexible attribute query is run by beets: once, for the records of the main pass
+        with mock.patch.object(Library, "items", autospec=True, side_effect=Library.items) as items:
+            stub = self.run_with_stub(browse_resolver, "--prefetch-artists", "source:cd")
+
+        self.assertEqual(1, items.call_count)
+        self.assertEqual(2, stub.request_count)
+        self.assertEqual(1965, self.lib.items(u'title:"song 5"').get().original_year)
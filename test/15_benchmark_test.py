@@ -0,0 +1,27 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from unittest import TestCase
+
+import beets
+
+from test.benchmark import run_benchmark
+
+
+class BenchmarkTest(TestCase):
+    """Test that the benchmark runs on a small synthetic library.
+    """
+
+    def tearDown(self):
+        beets.config.clear()
+
+    def test_run_benchmark(self):
+        results = run_benchmark(artists=2, albums=2, tracks=3, missing=1.0, command_args=["--workers", "2"])
+
+        self.assertEqual(12, results["selected_items"])
+        self.assertEqual(12, results["http_calls"])
+        self.assertGreater(results["db_queries"], 0)
+        self.assertGreater(results["items_per_second"], 0)
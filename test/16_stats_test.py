@@ -0,0 +1,49 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from beets.library import Item
+
+from beetsplug.yearfixer.stats import LatencyHistogram, RunStats
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+class StatsTest(TestHelper, Assertions):
+    """Test the run statistics and report.
+    """
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for seconds in (0.0005, 0.003, 0.003, 0.003, 0.5):
+            histogram.add(seconds)
+
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(0.004, histogram.percentile(50))
+        self.assertEqual(0.5, histogram.percentile(100))
+
+    def test_count_from_threads(self):
+        stats = RunStats()
+        with ThreadPoolExecutor(8) as pool:
+            for _ in range(8):
+                pool.submit(lambda: [stats.count("requests") for _ in range(10000)])
+
+        self.assertEqual(80000, stats.counters["requests"])
+
+    def test_report(self):
+        self.lib.add(Item(title=u'a', mb_albumid=u'alb-1', year=0, original_year=1990))
+        self.lib.add(Item(title=u'b', mb_albumid=u'alb-1', year=1990, original_year=1990))
+        path = os.path.join(self.mkdtemp(), "report.json")
+
+        self.runcli(PLUGIN_NAME, "--report", path)
+
+        with open(path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(1, report["counters"]["items_seen"])
+        self.assertEqual(1, report["counters"]["year_from_album_mean"])
+        self.assertEqual(1, report["stages"]["store"]["count"])
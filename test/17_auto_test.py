@@ -0,0 +1,48 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from beets.library import Item
+
+from beetsplug.yearfixer import YearFixerPlugin
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+from test.mbstub import MusicBrainzStub
+
+
+def recording_resolver(path, params):
+    return 200, {"recordings": [{"releases": [{"date": "1971"}]}]}
+
+
+class AutoTest(TestHelper, Assertions):
+    """Test the fixing of imported and modified items.
+    """
+
+    def test_fix_imported_album(self):
+        other = Item(title=u'other', mb_artistid=u'art-1', year=0, original_year=0)
+        self.lib.add(other)
+
+        self.config[PLUGIN_NAME]["auto"] = True
+        self.config[PLUGIN_NAME]["cache"]["enabled"] = False
+        self.config[PLUGIN_NAME]["musicbrainz"]["rate_limit"] = 0
+        plugin = YearFixerPlugin()
+        plugin.commands()
+
+        album = self.lib.add_album([
+            Item(title=u'a', mb_artistid=u'art-1', mb_albumid=u'alb-1', year=1980, original_year=1980),
+            Item(title=u'b', mb_artistid=u'art-1', mb_albumid=u'alb-1', year=0, original_year=0),
+        ])
+        plugin.on_album_imported(self.lib, album)
+
+        with MusicBrainzStub(recording_resolver) as stub:
+            self.config[PLUGIN_NAME]["musicbrainz"]["base_url"] = stub.base_url
+            plugin.on_import(self.lib, [])
+
+        self.assertEqual(1, stub.request_count)
+        fixed = [item for item in album.items() if item.title == u'b'][0]
+        self.assertEqual(1980, fixed.year)
+        self.assertEqual(1971, fixed.original_year)
+        self.assertEqual(0, self.lib.get_item(other.id).year)
+        # the changes made by the plugin itself are not queued again
+        self.assertEqual({}, plugin.pending_item_ids)
@@ -0,0 +1,83 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+from unittest import mock
+
+from beets.library import Item
+
+from beetsplug.yearfixer.common import PENDING_WRITE_ATTR
+from test.helper import TestHelper, Assertions, PLUGIN_NAME, capture_log
+
+
+class LocalOnlyTest(TestHelper, Assertions):
+    """Test the set based pass applying the album and artist means.
+    """
+
+    def add_items(self):
+        items = {
+            "a": Item(title=u'a', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1990, original_year=1990),
+            "b": Item(title=u'b', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1991, original_year=1991),
+            "c": Item(title=u'c', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0),
+            "d": Item(title=u'd', mb_albumid=u'alb-2', mb_artistid=u'art-1', year=0, original_year=0),
+            "e": Item(title=u'e', mb_albumid=u'alb-3', mb_artistid=u'art-2', year=1985, original_year=0),
+            "f": Item(title=u'f', mb_albumid=u'alb-4', mb_artistid=u'art-3', year=0, original_year=0),
+        }
+        for item in items.values():
+            self.lib.add(item)
+        return items
+
+    def test_same_results_as_item_by_item_run(self):
+        items = self.add_items()
+        self.runcli(PLUGIN_NAME, "--local-only", "--no-write")
+        local = {title: (item.year, item.original_year) for title, item in
+                 ((item.title, self.lib.get_item(item.id)) for item in items.values())}
+
+        self.assertEqual((1990, 1990), local["c"])
+        self.assertEqual((1990, 1990), local["d"])
+        self.assertEqual((1985, 1985), local["e"])
+        self.assertEqual((0, 0), local["f"])
+        self.assertIn(PENDING_WRITE_ATTR, self.lib.get_item(items["c"].id))
+        self.assertNotIn(PENDING_WRITE_ATTR, self.lib.get_item(items["f"].id))
+
+        self.reset_beets(config_file=b"empty.yml")
+        items = self.add_items()
+        self.run_with_stub(None, "--no-write")
+        for item in items.values():
+            stored = self.lib.get_item(item.id)
+            self.assertEqual(local[stored.title], (stored.year, stored.original_year))
+
+    def test_dry_run(self):
+        items = self.add_items()
+        with capture_log('beets.{}'.format(PLUGIN_NAME)) as logs:
+            self.runcli(PLUGIN_NAME, "--local-only", "--dry-run")
+
+        self.assertIn("yearfixer:  -  - c: year: 0 -> 1990, original_year: 0 -> 1990", logs)
+        self.assertIn("yearfixer: 3 items would be changed.", logs)
+        self.assertEqual(0, self.lib.get_item(items["c"].id).year)
+
+    def test_plan_is_rejected(self):
+        items = self.add_items()
+        path = os.path.join(self.mkdtemp(), "changes.jsonl")
+
+        with mock.patch.object(Item, "try_write", autospec=True) as try_write:
+            output = self.runcli(PLUGIN_NAME, "--local-only", "--plan", path)
+
+        self.assertIn("--plan cannot be used with --local-only.", output)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(0, try_write.call_count)
+        item = self.lib.get_item(items["c"].id)
+        self.assertEqual((0, 0), (item.year, item.original_year))
+
+    def test_dry_run_needs_local_only(self):
+        items = self.add_items()
+
+        with mock.patch.object(Item, "try_write", autospec=True) as try_write:
+            output = self.runcli(PLUGIN_NAME, "--dry-run")
+
+        self.assertIn("--dry-run can only be used with --local-only", output)
+        self.assertEqual(0, try_write.call_count)
+        self.assertEqual(0, self.lib.get_item(items["c"].id).year)
@@ -0,0 +1,52 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+
+from beets.library import Item
+
+from beetsplug.yearfixer.changeset import read_changeset
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+def recording_resolver(path, params):
+    return 200, {"recordings": [{"releases": [{"date": "1971"}]}]}
+
+
+class PlanApplyTest(TestHelper, Assertions):
+    """Test the planning of the changes and their application.
+    """
+
+    def test_plan_and_apply(self):
+        items = [
+            Item(title=u'a', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1980, original_year=1980),
+            Item(title=u'b', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0),
+            Item(title=u'c', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0),
+        ]
+        for item in items:
+            self.lib.add(item)
+        path = os.path.join(self.mkdtemp(), "changes.jsonl")
+
+        self.run_with_stub(recording_resolver, "--plan", path)
+
+        changes = list(read_changeset(path))
+        self.assertEqual([items[1].id, items[2].id], [change["id"] for change in changes])
+        self.assertEqual({"year": 0, "original_year": 0}, changes[0]["old"])
+        self.assertEqual({"year": 1980, "original_year": 1971}, changes[0]["new"])
+        self.assertEqual({"year": "album_mean", "original_year": "musicbrainz"}, changes[0]["source"])
+        self.assertEqual(0, self.lib.get_item(items[1].id).year)
+
+        # changed since the plan was made
+        stored = self.lib.get_item(items[2].id)
+        stored.year = 1999
+        stored.store()
+
+        self.runcli(PLUGIN_NAME, "--apply", path, "--no-write")
+
+        self.assertEqual((1980, 1971), (self.lib.get_item(items[1].id).year,
+                                        self.lib.get_item(items[1].id).original_year))
+        self.assertEqual((1999, 0), (self.lib.get_item(items[2].id).year,
+                                     self.lib.get_item(items[2].id).original_year))
@@ -0,0 +1,22 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+from unittest import TestCase
+
+from test.importtime import get_import_times, LOAD_PLUGIN
+
+
+class ImportTest(TestCase):
+    """Test that loading the plugin does not import the modules only needed by its commands.
+    """
+
+    def test_lazy_imports(self):
+        modules = get_import_times(LOAD_PLUGIN)
+
+        self.assertIn("beetsplug.yearfixer.command", modules)
+        for module in ("requests", "beetsplug.yearfixer.musicbrainz", "beetsplug.yearfixer.offline",
+                       "beetsplug.yearfixer.pipeline", "cProfile"):
+            self.assertNotIn(module, modules)
@@ -0,0 +1,41 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import time
+
+from beets.library import Item
+
+from beetsplug.yearfixer.common import CHECKED_ATTR, OUTCOME_ATTR
+from test.helper import TestHelper, Assertions
+
+
+class SinceLastRunTest(TestHelper, Assertions):
+    """Test the skipping of the items checked by previous runs.
+    """
+
+    def run_since_last_run(self):
+        return self.run_with_stub(None, "--since-last-run").request_count
+
+    def test_since_last_run(self):
+        item = Item(title=u'song', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0, mtime=1000.5)
+        self.lib.add(item)
+
+        self.assertEqual(1, self.run_since_last_run())
+        self.assertEqual("unresolved", self.lib.get_item(item.id).get(OUTCOME_ATTR))
+        self.assertEqual(0, self.run_since_last_run())
+
+        # retried once `retry_after_days` have passed
+        stored = self.lib.get_item(item.id)
+        stored[CHECKED_ATTR] = time.time() - 31 * 86400
+        stored.store()
+        self.assertEqual(1, self.run_since_last_run())
+        self.assertEqual(0, self.run_since_last_run())
+
+        # checked again once modified
+        stored = self.lib.get_item(item.id)
+        stored.mtime = 2000.0
+        stored.store()
+        self.assertEqual(1, self.run_since_last_run())
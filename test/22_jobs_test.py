@@ -0,0 +1,77 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+from unittest import mock
+
+from beets.library import Library, Item
+
+from beetsplug.yearfixer.common import PENDING_WRITE_ATTR
+from beetsplug.yearfixer.jobs import get_shards
+from test.helper import TestHelper, Assertions
+
+
+def recording_resolver(path, params):
+    year = 1960 + len(params.get("query", ""))
+    return 200, {"recordings": [{"score": 100, "releases": [{"date": str(year)}]}]}
+
+
+class JobsTest(TestHelper, Assertions):
+    """Test the fixing of the items in worker processes.
+    """
+
+    def add_items(self):
+        items = [
+            Item(title=u'a', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1980, original_year=0),
+            Item(title=u'bb', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=0),
+            Item(title=u'ccc', mb_albumid=u'alb-2', mb_artistid=u'art-2', year=0, original_year=1990),
+            Item(title=u'dddd', mb_albumid=u'alb-3', mb_artistid=u'art-2', year=0, original_year=0),
+            Item(title=u'eeeee', mb_albumid=u'alb-4', mb_artistid=u'art-3', year=0, original_year=0),
+        ]
+        for item in items:
+            self.lib.add(item)
+        return items
+
+    def run_command(self, *args, cache=False):
+        self.run_with_stub(recording_resolver, *args, cache=cache)
+
+        return {item.title: (item.year, item.original_year) for item in self.lib.items()}
+
+    def test_shards_keep_albums_and_artists_together(self):
+        items = self.add_items()
+        shards = get_shards(items, 2)
+
+        self.assertEqual(2, len(shards))
+        self.assertEqual([items[2].id, items[3].id], shards[1])
+        self.assertEqual(sorted(item.id for item in items), sorted(shards[0] + shards[1]))
+        self.assertEqual(1, len(get_shards(items, 1)))
+
+    def test_jobs_match_serial_run(self):
+        self.add_items()
+        serial = self.run_command()
+
+        self.lib = Library(os.path.join(self.mkdtemp(), 'library.db'), self.libdir)
+        self.add_items()
+        self.assertEqual(serial, self.run_command("--jobs", "3"))
+        self.assertNotIn(0, serial[u'dddd'])
+
+    def test_tags_are_written_by_the_main_process(self):
+        self.lib = Library(os.path.join(self.mkdtemp(), 'library.db'), self.libdir)
+        self.add_items()
+
+        # the workers are spawned: they do not see the mock
+        with mock.patch.object(Item, "try_write", autospec=True, return_value=True) as try_write:
+            years = self.run_command("--jobs", "3", cache=True)
+
+        self.assertEqual(5, try_write.call_count)
+        self.assertNotIn(0, years[u'eeeee'])
+        self.assertFalse(any(PENDING_WRITE_ATTR in item for item in self.lib.items()))
+
+        # the lookups were cached by the workers
+        self.lib = Library(os.path.join(self.mkdtemp(), 'library.db'), self.libdir)
+        self.add_items()
+        stub = self.run_with_stub(recording_resolver, "--jobs", "3", cache=True)
+        self.assertEqual(0, stub.request_count)
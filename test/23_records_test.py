@@ -0,0 +1,76 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import os
+
+from beets.dbcore.query import MatchQuery, TrueQuery
+from beets.library import Item
+
+from beetsplug.yearfixer.changeset import read_changeset
+from beetsplug.yearfixer.common import CHECKED_ATTR, OUTCOME_ATTR
+from beetsplug.yearfixer.records import load_item_records, load_item_records_by_id, RECORD_FIELDS
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+class RecordsTest(TestHelper, Assertions):
+    """Test the loading of the selected items as records.
+    """
+
+    def test_records_match_items(self):
+        self.lib.add(Item(title=u'b', artist=u'x', mb_albumid=u'alb-1', mb_trackid=u'rec-1', year=1990))
+        item = Item(title=u'a', artist=u'x', mb_artistid=u'art-1', original_year=1980)
+        item[CHECKED_ATTR] = 1000.0
+        item[OUTCOME_ATTR] = u'fixed'
+        self.lib.add(item)
+
+        records = load_item_records(self.lib, TrueQuery(), with_markers=True)
+        items = list(self.lib.items())
+        for record, expected in zip(records, items):
+            self.assertEqual([expected.get(field) for field in RECORD_FIELDS],
+                             [record.get(field) for field in RECORD_FIELDS])
+        self.assertIn(CHECKED_ATTR, records[1])
+        self.assertNotIn(CHECKED_ATTR, records[0])
+
+        # flexible attribute queries are run by beets
+        records = load_item_records(self.lib, MatchQuery(OUTCOME_ATTR, u'fixed', fast=False))
+        self.assertEqual([item.id], [record.id for record in records])
+
+    def test_records_by_id(self):
+        ids = [self.lib.add(Item(title=title)) for title in (u'a', u'b', u'c', u'd', u'e')]
+
+        records = load_item_records_by_id(self.lib, [ids[3], ids[0], 999, ids[4], ids[1]], chunk_size=2)
+        self.assertEqual([u'd', u'a', u'e', u'b'], [record.title for record in records])
+
+    def test_only_changed_items_are_loaded(self):
+        self.lib.add(Item(title=u'a', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=0, original_year=1990))
+        self.lib.add(Item(title=u'b', mb_albumid=u'alb-2', mb_artistid=u'art-2', year=0, original_year=0))
+        self.lib.add(Item(title=u'c', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1990, original_year=1990))
+        path = os.path.join(self.mkdtemp(), "report.json")
+
+        self.run_with_stub(None, "--report", path)
+
+        with open(path) as report_file:
+            counters = json.load(report_file)["counters"]
+        self.assertEqual(2, counters["items_seen"])
+        self.assertEqual(1, counters["items_loaded"])
+        self.assertEqual(1990, self.lib.items(u'title:a').get().year)
+
+    def test_null_years_are_read_as_items_read_them(self):
+        self.lib.add(Item(title=u'a', mb_albumid=u'alb-1', year=1990, original_year=1990))
+        item = self.lib.add(Item(title=u'b', mb_albumid=u'alb-1'))
+        with self.lib.transaction() as tx:
+            tx.mutate("UPDATE items SET year = NULL, original_year = '' WHERE id = ?", (item,))
+
+        records = load_item_records(self.lib, TrueQuery())
+        self.assertEqual((0, 0), (records[1].year, records[1].original_year))
+
+        path = os.path.join(self.mkdtemp(), "changes.jsonl")
+        self.run_with_stub(None, "--plan", path)
+        self.assertEqual([{"year": 0, "original_year": 0}], [change["old"] for change in read_changeset(path)])
+
+        self.runcli(PLUGIN_NAME, "--apply", path, "--no-write")
+        self.assertEqual((1990, 1990), (self.lib.get_item(item).year, self.lib.get_item(item).original_year))
@@ -0,0 +1,72 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import os
+
+from beets.library import Item
+from confuse import ConfigValueError
+
+from beetsplug.yearfixer.providers import YearMapProvider, get_provider_names
+from test.helper import TestHelper, Assertions, PLUGIN_NAME
+
+
+def recording_resolver(path, params):
+    return 200, {"recordings": [{"score": 100, "releases": [{"date": "1971"}]}]}
+
+
+class ProvidersTest(TestHelper, Assertions):
+    """Test the year provider chain.
+    """
+
+    def run_command(self):
+        report = os.path.join(self.mkdtemp(), "report.json")
+        stub = self.run_with_stub(recording_resolver, "--report", report)
+
+        with open(report) as report_file:
+            return stub.request_count, json.load(report_file)
+
+    def test_year_map(self):
+        path = os.path.join(self.mkdtemp(), "years.csv")
+        with open(path, "w") as map_file:
+            map_file.write("mb_trackid,mb_albumid,mb_artistid,title,year,original_year\n"
+                           "rec-1,,,,1985,1965\n"
+                           ",alb-1,,,1990,\n"
+                           ",,art-1,Some Song,,1970\n")
+        provider = YearMapProvider(path)
+
+        self.assertEqual(1965, provider.lookup(Item(mb_trackid=u'rec-1', mb_albumid=u'alb-1'), "original_year"))
+        self.assertEqual(1985, provider.lookup(Item(mb_trackid=u'rec-1', mb_albumid=u'alb-1'), "year"))
+        self.assertEqual(1990, provider.lookup(Item(mb_trackid=u'rec-2', mb_albumid=u'alb-1'), "year"))
+        self.assertEqual(1970, provider.lookup(Item(mb_artistid=u'art-1', title=u'some song'), "original_year"))
+        self.assertIsNone(provider.lookup(Item(mb_trackid=u'rec-2', mb_albumid=u'alb-1'), "original_year"))
+
+        self.lib.add(Item(title=u'a', mb_trackid=u'rec-1', year=0, original_year=0))
+        self.config[PLUGIN_NAME]["providers"]["year_map"] = path
+        request_count, report = self.run_command()
+
+        self.assertEqual(0, request_count)
+        self.assertEqual((1985, 1965), tuple(self.lib.items().get()[field] for field in ("year", "original_year")))
+        self.assertEqual(1.0, report["hit_rates"]["provider_year_map"])
+
+    def test_cheap_providers_first(self):
+        for title, year in ((u'a', 1980), (u'b', 1980), (u'c', 0)):
+            self.lib.add(Item(title=title, mb_albumid=u'alb-1', mb_artistid=u'art-1', year=year, original_year=year))
+        self.lib.add(Item(title=u'd', mb_albumid=u'alb-2', mb_artistid=u'art-2', year=0, original_year=0))
+        self.config[PLUGIN_NAME]["providers"]["original_year"] = ["album_mean", "musicbrainz"]
+        self.config[PLUGIN_NAME]["providers"]["min_mean_items"] = 2
+        request_count, report = self.run_command()
+
+        # only the item of the album without a settled mean is looked up
+        self.assertEqual(1, request_count)
+        self.assertEqual(1980, self.lib.items(u'title:c').get().original_year)
+        self.assertEqual(1971, self.lib.items(u'title:d').get().original_year)
+        self.assertEqual(1, report["counters"]["original_year_from_album_mean"])
+
+    def test_unknown_provider(self):
+        self.config[PLUGIN_NAME]["providers"]["year"] = ["album_mean", "discogs"]
+        with self.assertRaises(ConfigValueError):
+            get_provider_names(self.config[PLUGIN_NAME]["providers"], "year")
@@ -0,0 +1,107 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import os
+
+from beets.library import Item
+
+from beetsplug.yearfixer.common import LOOKUP_PATH_ATTR
+from test.helper import TestHelper, Assertions, PLUGIN_NAME, capture_log
+
+
+def release_group_resolver(path, params):
+    if path.endswith("/release-group/rg-1"):
+        return 200, {"id": "rg-1", "first-release-date": "1969-10-10"}
+    return 404, {"error": "Not Found"}
+
+
+class PerAlbumTest(TestHelper, Assertions):
+    """Test the album by album processing.
+    """
+
+    def run_per_album(self, *args):
+        stub = self.run_with_stub(release_group_resolver, "--per-album", *args)
+
+        return stub.request_count
+
+    def test_release_group_year(self):
+        album = self.lib.add_album([
+            Item(title=u'a', mb_artistid=u'art-1', year=1975, original_year=0),
+            Item(title=u'b', mb_artistid=u'art-1', year=0, original_year=1970),
+            Item(title=u'c', mb_artistid=u'art-1', year=0, original_year=0),
+        ])
+        album.mb_releasegroupid = u'rg-1'
+        album.store()
+
+        self.assertEqual(1, self.run_per_album())
+
+        album = self.lib.get_album(album.id)
+        self.assertEqual((1975, 1969), (album.year, album.original_year))
+        # only the missing values are filled in
+        self.assertEqual([(1975, 1969), (1975, 1970), (1975, 1969)],
+                         [(item.year, item.original_year) for item in album.items()])
+        # the lookup is recorded on the tracks whose original year comes from it
+        self.assertEqual(["release-group", None, "release-group"],
+                         [item.get(LOOKUP_PATH_ATTR) for item in album.items()])
+
+        # nothing is missing anymore
+        self.assertEqual(0, self.run_per_album())
+
+        self.assertEqual(1, self.run_per_album("--force"))
+        self.assertEqual([(1975, 1969)] * 3, [(item.year, item.original_year) for item in album.items()])
+
+    def test_album_means(self):
+        complete = self.lib.add_album([
+            Item(title=u'a', mb_artistid=u'art-1', year=1980, original_year=1980),
+        ])
+        album = self.lib.add_album([
+            Item(title=u'b', mb_artistid=u'art-1', year=0, original_year=0),
+            Item(title=u'c', mb_artistid=u'art-1', year=0, original_year=0),
+        ])
+        single = self.lib.add_album([Item(title=u'd', mb_artistid=u'art-2', year=1990, original_year=0)])
+
+        self.assertEqual(0, self.run_per_album())
+
+        self.assertEqual([(1980, 1980)] * 2, [(item.year, item.original_year) for item in album.items()])
+        single = self.lib.get_album(single.id)
+        self.assertEqual((1990, 1990), (single.year, single.original_year))
+        self.assertEqual(1980, self.lib.get_album(complete.id).year)
+
+    def test_plan_is_rejected(self):
+        album = self.lib.add_album([Item(title=u'a', mb_artistid=u'art-1', year=1980, original_year=0)])
+        item = album.items().get()
+        path = os.path.join(self.mkdtemp(), "changes.jsonl")
+
+        output = self.runcli(PLUGIN_NAME, "--per-album", "--plan", path)
+
+        self.assertIn("--plan cannot be used with --per-album.", output)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(0, self.lib.get_item(item.id).original_year)
+
+    def test_providers_order(self):
+        album = self.lib.add_album([
+            Item(title=u'a', mb_artistid=u'art-1', year=1975, original_year=1970),
+            Item(title=u'b', mb_artistid=u'art-1', year=0, original_year=0),
+        ])
+        album.mb_releasegroupid = u'rg-1'
+        album.store()
+        self.config[PLUGIN_NAME]["providers"]["original_year"] = ["album_mean", "musicbrainz"]
+
+        self.assertEqual(0, self.run_per_album())
+
+        self.assertEqual([(1975, 1970)] * 2, [(item.year, item.original_year) for item in album.items()])
+        self.assertEqual([None, None], [item.get(LOOKUP_PATH_ATTR) for item in album.items()])
+
+    def test_items_not_in_an_album(self):
+        self.lib.add_album([Item(title=u'a', mb_albumid=u'alb-1', mb_artistid=u'art-1', year=1980, original_year=0)])
+        single = self.lib.add(Item(title=u'b', mb_artistid=u'art-2', year=1985, original_year=0))
+
+        with capture_log('beets.yearfixer') as logs:
+            self.run_per_album("--page-size", "10")
+
+        self.assertIn("Ignoring --page-size with --per-album.", "\n".join(logs))
+        self.assertIn("Fixing 1 items not in an album.", "\n".join(logs))
+        self.assertEqual((1985, 1985), (self.lib.get_item(single).year, self.lib.get_item(single).original_year))
@@ -0,0 +1,226 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+"""Benchmark of the yearfixer command on a synthetic library.
+
+The library is generated in a temporary directory and all MusicBrainz requests are
+answered by a local stub server, so the benchmark runs offline. Usage:
+
+    python -m test.benchmark [--artists N] [--albums N] [--tracks N] [--missing SHARE]
+                             [--latency SECONDS] [--error-rate SHARE] [--json]
+                             [-- YEARFIXER OPTIONS...]
+
+Options after `--` are passed to the command, e.g. `-- --workers 4 --page-size 500`.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import beets
+from beets import logging
+from beets.library import Library, Item
+
+from beetsplug.yearfixer import YearFixerPlugin
+from test.mbstub import MusicBrainzStub
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class TracedLibrary(Library):
+    """Library counting the SQL statements run on all of its connections."""
+
+    def __init__(self, *args, **kwargs):
+        self.query_count = 0
+        self._count_lock = threading.Lock()
+        super(TracedLibrary, self).__init__(*args, **kwargs)
+
+    def _create_connection(self):
+        conn = super(TracedLibrary, self)._create_connection()
+        conn.set_trace_callback(self._count_query)
+        return conn
+
+    def _count_query(self, statement):
+        with self._count_lock:
+            self.query_count += 1
+
+
+def get_year(title):
+    return 1950 + zlib.crc32(title.encode("utf-8")) % 70
+
+
+def generate_library(lib, artists, albums, tracks, missing, seed=0):
+    """Adds `artists` x `albums` x `tracks` items to the library.
+
+    A `missing` share of the albums lack their years. Half of the items have a
+    recording id. Every album has a release group id. Returns the recordings by
+    artist id for the stub to serve.
+    """
+    rnd = random.Random(seed)
+    catalogue = {}
+
+    with lib.transaction():
+        for ar in range(artists):
+            mb_artistid = "artist-{}".format(ar)
+            recordings = catalogue.setdefault(mb_artistid, [])
+            for al in range(albums):
+                mb_albumid = "album-{}-{}".format(ar, al)
+                album_missing = rnd.random() < missing
+                items = []
+                for tr in range(tracks):
+                    title = "Song {} {} {}".format(ar, al, tr)
+                    mb_trackid = "rec-{}-{}-{}".format(ar, al, tr)
+                    recordings.append({"id": mb_trackid, "title": title})
+                    year = 0 if album_missing else get_year(title)
+                    items.append(Item(
+                        title=title, artist="Artist {}".format(ar), album="Album {} {}".format(ar, al),
+                        mb_artistid=mb_artistid, mb_albumid=mb_albumid,
+                        mb_releasegroupid="rg-{}-{}".format(ar, al),
+                        mb_trackid=mb_trackid if rnd.random() < 0.5 else "",
+                        track=tr + 1, year=year, original_year=year,
+                        path="/nonexistent/{}/{}/{}.mp3".format(ar, al, tr).encode("utf-8"),
+                    ))
+                lib.add_album(items)
+
+    return catalogue
+
+
+def make_resolver(catalogue):
+    """Answers recording and release group lookups, searches and artist browses from the synthetic catalogue."""
+
+    def release(title):
+        return {"date": "{}-01-01".format(get_year(title))}
+
+    def resolver(path, params):
+        if path == "/ws/2/recording" and "artist" in params:
+            recordings = catalogue.get(params["artist"], [])
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", 25))
+            page = [dict(rec, **{"first-release-date": release(rec["title"])["date"]})
+                    for rec in recordings[offset:offset + limit]]
+            return 200, {"recording-count": len(recordings), "recording-offset": offset, "recordings": page}
+
+        if path.startswith("/ws/2/recording/") and path != "/ws/2/recording/":
+            mb_trackid = path.rsplit("/", 1)[1]
+            parts = mb_trackid.split("-")
+            title = "Song {}".format(" ".join(parts[1:]))
+            return 200, {"id": mb_trackid, "title": title, "releases": [release(title)]}
+
+        if path.startswith("/ws/2/release-group/"):
+            parts = path.rsplit("/", 1)[1].split("-")
+            return 200, {"first-release-date": release("Song {} {} 0".format(parts[1], parts[2]))["date"]}
+
+        query = params.get("query", "")
+        title = query.split('recording:"', 1)[-1].rstrip('"')
+        return 200, {"recordings": [
+            {"score": 100, "title": title, "releases": [release(title)]},
+            {"score": 60, "title": title + " (live)", "releases": [{"date": "2015"}]},
+        ]}
+
+    return resolver
+
+
+def get_peak_memory():
+    """Returns the peak resident set size of the process in MiB (None if unknown)."""
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_benchmark(artists=20, albums=5, tracks=10, missing=0.5, latency=0.0, error_rate=0.0,
+                  seed=0, command_args=()):
+    """Runs the command once on a fresh synthetic library and returns the measurements."""
+    tmp_dir = tempfile.mkdtemp()
+    os.environ["BEETSDIR"] = tmp_dir
+    try:
+        beets.config.clear()
+        beets.config.read(user=False, defaults=True)
+        beets.config["directory"] = tmp_dir
+
+        plugin = YearFixerPlugin()
+        plugin.config["write"] = False
+        plugin.config["musicbrainz"]["rate_limit"] = 0
+        plugin.config["musicbrainz"]["backoff_base"] = 0.01
+        command = plugin.commands()[0]
+
+        lib = TracedLibrary(os.path.join(tmp_dir, "library.db"), tmp_dir)
+        catalogue = generate_library(lib, artists, albums, tracks, missing, seed)
+
+        options, arguments = command.parser.parse_args(list(command_args))
+        command.query = arguments
+        command.cfg_force = options.force
+        selected = len(lib.items(command.get_selection_query()[0]))
+
+        with MusicBrainzStub(make_resolver(catalogue), latency=latency, error_rate=error_rate, seed=seed) as stub:
+            plugin.config["musicbrainz"]["base_url"] = stub.base_url
+            lib.query_count = 0
+            started = time.perf_counter()
+            command.func(lib, options, arguments)
+            elapsed = time.perf_counter() - started
+
+        lib._close()
+    finally:
+        del os.environ["BEETSDIR"]
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    per_item = max(selected, 1)
+    return {
+        "library_items": artists * albums * tracks,
+        "selected_items": selected,
+        "elapsed": elapsed,
+        "items_per_second": selected / elapsed if elapsed else None,
+        "db_queries": lib.query_count,
+        "db_queries_per_item": lib.query_count / per_item,
+        "http_calls": stub.request_count,
+        "http_calls_per_item": stub.request_count / per_item,
+        "peak_memory_mib": get_peak_memory(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m test.benchmark",
+                                     description="Benchmark the yearfixer command on a synthetic library.")
+    parser.add_argument("--artists", type=int, default=20, help="number of artists [default: 20]")
+    parser.add_argument("--albums", type=int, default=5, help="albums per artist [default: 5]")
+    parser.add_argument("--tracks", type=int, default=10, help="tracks per album [default: 10]")
+    parser.add_argument("--missing", type=float, default=0.5,
+                        help="share of the albums without years [default: 0.5]")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latency of the MusicBrainz stub in seconds [default: 0]")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="share of the requests answered with a 503 [default: 0]")
+    parser.add_argument("--seed", type=int, default=0, help="random seed [default: 0]")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("command_args", nargs="*", help="options passed to the yearfixer command (after --)")
+    args = parser.parse_args(argv)
+
+    # keep the output of the command out of the results
+    logging.getLogger("beets").setLevel(logging.WARNING)
+
+    results = run_benchmark(args.artists, args.albums, args.tracks, args.missing, args.latency,
+                            args.error_rate, args.seed, args.command_args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, value in results.items():
+        print("{:<22}{}".format(name, "{:.3f}".format(value) if isinstance(value, float) else value))
+
+
+if __name__ == "__main__":
+    main()
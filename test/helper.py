@@ -33,6 +33,7 @@ from six import StringIO
 
 from beetsplug import yearfixer
 from beetsplug.yearfixer import common
+from test.mbstub import MusicBrainzStub, empty_resolver
 
 logging.getLogger('beets').propagate = True
 
@@ -211,6 +212,20 @@ class TestHelper(TestCase, Assertions):
                 print(u.args[0])
         return out.getvalue()
 
+    def run_with_stub(self, resolver=None, *args, cache=False, **stub_options):
+        """Runs the plugin command with `args` against a MusicBrainz stub answering with `resolver`.
+
+        Requests are not paced and the lookup cache is disabled unless `cache`. Returns
+        the (stopped) stub, e.g. to count the requests it served.
+        """
+        self.config[PLUGIN_NAME]["cache"]["enabled"] = cache
+        self.config[PLUGIN_NAME]["musicbrainz"]["rate_limit"] = 0
+        with MusicBrainzStub(resolver or empty_resolver, **stub_options) as stub:
+            self.config[PLUGIN_NAME]["musicbrainz"]["base_url"] = stub.base_url
+            self.runcli(PLUGIN_NAME, *args)
+
+        return stub
+
     def lib_path(self, path):
         return os.path.join(self.libdir, path.replace(b'/', bytestring_path(os.sep)))
 
@@ -0,0 +1,79 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+"""Import time of the plugin, as paid by every beet invocation.
+
+The plugin is loaded and its commands are built (what beets does on startup) in a fresh
+interpreter run with `-X importtime`. The modules already imported by beets itself are
+left out. Usage:
+
+    python -m test.importtime [--runs N] [--top N] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASELINE = "import beets.ui, beets.library, beets.plugins"
+LOAD_PLUGIN = BASELINE + "; from beetsplug.yearfixer import YearFixerPlugin; YearFixerPlugin().commands()"
+
+
+def get_import_times(code):
+    """Returns the self import time in microseconds of each module imported by `code`."""
+    # installed plugins are loaded from bytecode: let the first run write it
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(self_time)
+
+    return times
+
+
+def measure_plugin_imports(runs=5):
+    """Returns the median self import time in microseconds of each module imported by the plugin."""
+    samples = {}
+    for _ in range(runs):
+        baseline = get_import_times(BASELINE)
+        for module, self_time in get_import_times(LOAD_PLUGIN).items():
+            if module not in baseline:
+                samples.setdefault(module, []).append(self_time)
+
+    return {module: statistics.median(times) for module, times in samples.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m test.importtime",
+                                     description="Measure the import time of the plugin.")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs [default: 5]")
+    parser.add_argument("--top", type=int, default=15, help="number of modules listed [default: 15]")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    # a first run compiles the modules
+    get_import_times(LOAD_PLUGIN)
+    modules = measure_plugin_imports(args.runs)
+    total = sum(modules.values())
+
+    if args.json:
+        print(json.dumps({"total_us": total, "modules": modules}, indent=2))
+        return
+
+    print("Plugin import time: {:.1f}ms ({} modules)".format(total / 1000, len(modules)))
+    for module, self_time in sorted(modules.items(), key=lambda entry: -entry[1])[:args.top]:
+        print("{:>10.1f}ms  {}".format(self_time / 1000, module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#  Copyright: Copyright (c) 2020., Adam Jakab
+#
+#  Author: Adam Jakab <adam at jakab dot pro>
+#  Created: 3/27/20, 3:52 PM
+#  License: See LICENSE.txt
+
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+def empty_resolver(path, params):
+    return 200, {"recordings": []}
+
+
+class MusicBrainzStub:
+    """Local HTTP server answering MusicBrainz ws/2 requests with canned responses.
+
+    `resolver(path, params)` returns a (status, payload) tuple for each request. The
+    first `failures` requests and a random `error_rate` share of all the others are
+    answered with a 503 carrying the `retry_after` header (when set).
+    """
+
+    def __init__(self, resolver=empty_resolver, latency=0.0, failures=0, error_rate=0.0,
+                 retry_after=None, seed=0):
+        self.resolver = resolver
+        self.latency = latency
+        self.failures = failures
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.requests = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}/ws/2/".format(host, port)
+
+    @property
+    def request_count(self):
+        return len(self.requests)
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are sent separately: do not let them wait for delayed ACKs
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, payload, headers = stub._answer(self.path)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _answer(self, raw_path):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests.append((time.monotonic(), raw_path))
+            failing = len(self.requests) <= self.failures or self._random.random() < self.error_rate
+
+        if failing:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return 503, {"error": "rate limited"}, headers
+
+        parts = urlsplit(raw_path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        status, payload = self.resolver(parts.path, params)
+        return status, payload, {}